@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter so every measurement is a cold start, like a newly forked gunicorn worker.
+PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import app
+booted = time.perf_counter()
+app.app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'boot': booted - started,
+    'first_request': served - booted,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def export_revision(revision):
+    # A pristine copy of `revision` to measure next to the working tree.
+    target = tempfile.mkdtemp(prefix='boot-')
+    archive = subprocess.run(['git', 'archive', revision], cwd=ROOT, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    return target
+
+
+def measure(path, runs):
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'boot.sqlite3'),
+               app_secret_key='benchmark', api_key='benchmark')
+    # The first run only warms the bytecode cache and the OS page cache.
+    subprocess.run([sys.executable, '-c', PROBE], cwd=path, env=env, check=True, capture_output=True)
+    samples = [json.loads(subprocess.run([sys.executable, '-c', PROBE], cwd=path, env=env, check=True,
+                                         capture_output=True, text=True).stdout.splitlines()[-1])
+               for _ in range(runs)]
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold start of a web worker: importing app:app, '
+                                                 'serving the first request and the resulting memory.')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--compare', metavar='REVISION', help='also measure this git revision, e.g. HEAD~1')
+    args = parser.parse_args()
+
+    targets = [('working tree', ROOT)]
+    if args.compare:
+        targets.insert(0, (args.compare, export_revision(args.compare)))
+    print(f"median of {args.runs} cold starts")
+    for name, path in targets:
+        result = measure(path, args.runs)
+        print(f"{name:>14}: boot {result['boot'] * 1000:6.1f}ms  first request {result['first_request'] * 1000:6.1f}ms  "
+              f"max RSS {result['rss_mb']:5.1f}MB  {result['modules']:4.0f} modules")
+
+
+if __name__ == '__main__':
+    main()
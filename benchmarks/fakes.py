@@ -0,0 +1,212 @@
+import json
+import random
+import socketserver
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+CITY_NAMES = ['Warsaw', 'Krakow', 'Gdansk', 'Wroclaw', 'Poznan', 'London', 'Paris', 'Berlin', 'Madrid', 'Rome',
+              'Vienna', 'Prague', 'Lisbon', 'Dublin', 'Oslo', 'Helsinki', 'Athens', 'Budapest', 'Zurich', 'Amsterdam']
+DISTRICTS = ['North', 'South', 'East', 'West', 'Old Town']
+TAILS = ['a', 'ak', 'an', 'berg', 'burg', 'by', 'dale', 'el', 'en', 'ford', 'ham', 'holm', 'in', 'ka', 'ley', 'mont',
+         'na', 'ov', 'stadt', 'ton', 'ville', 'wick', 'wood', 'y']
+
+
+def build_places():
+    # A small gazetteer where places share prefixes the way real ones do: each city has districts named after
+    # it, and a varying number of smaller towns share its first three letters, so some three-letter prefixes
+    # fit in one page of results and others do not.
+    places = []
+    for city in CITY_NAMES:
+        population = 500_000 + zlib.crc32(city.encode()) % 1_500_000
+        places.append((city, population))
+        places += [(f'{city} {district}', population // (3 + i)) for i, district in enumerate(DISTRICTS)]
+        towns = 6 + zlib.crc32(city[:3].encode()) % len(TAILS)
+        places += [(city[:3] + tail, 5_000 + zlib.crc32((city + tail).encode()) % 60_000) for tail in TAILS[:towns]]
+    return sorted(set(places), key=lambda place: -place[1])
+
+
+PLACES = build_places()
+
+
+class Server(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections under benchmark concurrency, which shows up
+    # as one-second SYN retransmits in the latencies.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def owm_id(city):
+    # Stable OpenWeatherMap-like id for a city name, so seeded cities and the fake agree on ids.
+    return zlib.crc32(city.encode()) % 10_000_000 + 1
+
+
+def weather_entry(city, city_id=None):
+    return {
+        'cod': 200, 'id': city_id or owm_id(city), 'name': city,
+        'main': {'temp': 285.0}, 'coord': {'lon': 21.0, 'lat': 52.2},
+        'weather': [{'description': 'clear sky', 'icon': '01d'}],
+    }
+
+
+def openweathermap(path, params, names):
+    if path.endswith('/group'):
+        ids = params['id'][0].split(',')
+        entries = [weather_entry(names.get(int(i), f'City {i}'), int(i)) for i in ids]
+        return 200, {'cnt': len(entries), 'list': entries}
+    if 'q' in params:
+        city = params['q'][0]
+        city_id = owm_id(city)
+        names[city_id] = city
+    else:
+        city_id = int(params['id'][0])
+        city = names.get(city_id, f'City {city_id}')
+    if path.endswith('/forecast'):
+        return 200, {'cod': '200', 'city': {'name': city, 'timezone': 3600, 'id': city_id},
+                     'list': [{'dt': 1700000000 + i * 10800, 'main': {'temp': 270.0 + i % 8},
+                               'wind': {'speed': 3.0}, 'rain': {'3h': 0.5}} for i in range(40)]}
+    return 200, weather_entry(city, city_id)
+
+
+def geonames(path, params, names):
+    # Up to `maxRows` places of PLACES starting with the prefix, most populous first.
+    prefix = params['name_startsWith'][0].casefold()
+    rows = int(params.get('maxRows', ['20'])[0])
+    matches = [(name, population) for name, population in PLACES if name.casefold().startswith(prefix)][:rows]
+    return 200, {'geonames': [{'name': name, 'asciiName': name, 'adminName1': 'Region', 'countryName': 'Country',
+                               'population': population} for name, population in matches]}
+
+
+def newsapi(path, params, names):
+    city = params.get('q', ['+City'])[0].lstrip('+')
+    return 200, {'status': 'ok', 'totalResults': 5,
+                 'articles': [{'title': f'{city} story {i}', 'url': f'https://news.example/{i}',
+                               'urlToImage': f'https://news.example/{i}.jpg', 'content': 'x' * 200}
+                              for i in range(5)]}
+
+
+class FakeUpstream:
+    # Local stand-in for one provider: answers after `latency` seconds and fails `failure_rate`
+    # of the requests with a 503.
+    def __init__(self, latency=0.1, failure_rate=0.0, respond=openweathermap):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.respond = respond
+        self.calls = 0
+        self.failures = 0
+        self.names = {}
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self.server = Server(('127.0.0.1', 0), self._handler())
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.failures = 0
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.calls += 1
+                    failed = fake._random.random() < fake.failure_rate
+                    if failed:
+                        fake.failures += 1
+                time.sleep(fake.latency)
+                url = urlparse(self.path)
+                if failed:
+                    status, data = 503, {'message': 'unavailable'}
+                else:
+                    status, data = fake.respond(url.path, parse_qs(url.query), fake.names)
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class FakeSMTP:
+    # Minimal SMTP server that accepts and discards messages, rejecting `failure_rate` of them with a 451.
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.messages = 0
+        self.failures = 0
+        self.sessions = 0
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+        self.server = SMTPServer(('127.0.0.1', 0), self._handler())
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _handler(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write((line + '\r\n').encode())
+
+            def handle(self):
+                with fake._lock:
+                    fake.sessions += 1
+                self.reply('220 fake-smtp')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip().upper()
+                    if command == 'DATA':
+                        self.reply('354 end with .')
+                        while self.rfile.readline().rstrip(b'\r\n') != b'.':
+                            pass
+                        time.sleep(fake.latency)
+                        with fake._lock:
+                            failed = fake._random.random() < fake.failure_rate
+                            if failed:
+                                fake.failures += 1
+                            else:
+                                fake.messages += 1
+                        self.reply('451 try again later' if failed else '250 queued')
+                    elif command == 'QUIT':
+                        self.reply('221 bye')
+                        return
+                    else:
+                        self.reply('250 ok')
+
+        return Handler
@@ -0,0 +1,124 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from benchmarks.fakes import FakeUpstream
+from benchmarks.suite import percentile
+from benchmarks.worker_load import free_port, start_gunicorn
+from extensions import db
+from factory import create_app
+from models import User
+
+PASSWORD = 'benchmark-password'
+CITIES = ['Warsaw', 'Krakow', 'Gdansk']
+
+
+def seed_users(database_url, users, method):
+    # Every user shares one hash: seeding should not take longer than the benchmark.
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    password_hash = generate_password_hash(PASSWORD, method)
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [{'username': f'user{i}', 'email': f'user{i}@bench.local',
+                                           'password': password_hash} for i in range(users)])
+        db.session.commit()
+
+
+def run_load(port, login_clients, readers, read_rate, users, duration):
+    # Login clients post credentials back to back (waiting Retry-After when refused). Readers request cached
+    # weather at `read_rate` requests per second in total, which costs a few milliseconds as long as the
+    # worker is free to serve it; they stand for the rest of the site's traffic.
+    base = f'http://127.0.0.1:{port}'
+    results = {'login': [], 'busy': 0, 'failed': 0, 'read': []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def login(number):
+        session = requests.Session()
+        i = number
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = session.post(base + '/login', data={'username': f'user{i % users}', 'password': PASSWORD},
+                                    timeout=60)
+            elapsed = time.perf_counter() - started
+            with lock:
+                if response.status_code == 503:
+                    results['busy'] += 1
+                    retry_after = float(response.headers.get('Retry-After', 0))
+                elif response.status_code == 200 and response.json().get('status') == 'success':
+                    results['login'].append(elapsed)
+                else:
+                    results['failed'] += 1
+            if response.status_code == 503:
+                time.sleep(retry_after)
+            i += login_clients
+
+    def read():
+        session = requests.Session()
+        next_at = time.monotonic()
+        while time.monotonic() < deadline:
+            next_at += readers / read_rate
+            time.sleep(max(0, next_at - time.monotonic()))
+            started = time.perf_counter()
+            session.post(base + '/get_multiple_weather', json={'cities': CITIES}, timeout=60)
+            with lock:
+                results['read'].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=login, args=(i,)) for i in range(login_clients)]
+    threads += [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results['login'].sort()
+    results['read'].sort()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login throughput and latency of other endpoints under a login burst.')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--worker-class', default='gevent')
+    parser.add_argument('--logins', type=int, default=20, help='concurrent login clients')
+    parser.add_argument('--readers', type=int, default=10, help='concurrent /get_multiple_weather clients')
+    parser.add_argument('--read-rate', type=float, default=100, help='/get_multiple_weather requests per second')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode')
+    parser.add_argument('--hash-workers', type=int, default=1, help='password_hash_workers for the pool mode')
+    parser.add_argument('--method', default='scrypt', help='password_hash_method')
+    parser.add_argument('--modes', nargs='+', default=['idle', 'inline', 'pool'],
+                        help='idle: no logins; inline: hashing in the request worker; pool: process pool')
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(0.05).start()
+    print(f"{args.workers} {args.worker_class} workers, {args.logins} login clients, weather at {args.read_rate:.0f} req/s, "
+          f"{args.method} hashes, {args.duration:.0f}s per mode")
+    for mode in args.modes:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+        seed_users(database_url, args.users, args.method)
+        port = free_port()
+        process = start_gunicorn(args.worker_class, args.workers, 8, upstream.url, port, DATABASE_URL=database_url,
+                                 weather_cache_ttl='600', password_hash_method=args.method,
+                                 password_hash_workers=str(0 if mode == 'inline' else args.hash_workers))
+        try:
+            result = run_load(port, 0 if mode == 'idle' else args.logins, args.readers, args.read_rate, args.users,
+                              args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+        logins, reads = result['login'], result['read']
+        print(f"{mode:>7}: logins {len(logins) / args.duration:6.1f}/s (p50 {percentile(logins, 0.5) * 1000:6.1f}ms, "
+              f"p95 {percentile(logins, 0.95) * 1000:6.1f}ms, {result['busy']} refused, {result['failed']} failed)  "
+              f"weather {len(reads) / args.duration:6.1f} req/s (p50 {percentile(reads, 0.5) * 1000:6.1f}ms, "
+              f"p95 {percentile(reads, 0.95) * 1000:6.1f}ms, p99 {percentile(reads, 0.99) * 1000:6.1f}ms)")
+    upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import itertools
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import insert
+
+from benchmarks.fakes import CITY_NAMES, owm_id
+from extensions import db
+from models import City, User, emails, favourites
+from notifications import drain_outbox, send_emails
+
+NOTIFICATION_SLOT = datetime(2026, 1, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def reset_database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+
+def insert_chunked(table, rows, chunk_size=10000):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        db.session.execute(insert(table), chunk)
+
+
+def run_clients(clients, work):
+    # Runs work(client_number, latencies, errors) on `clients` threads; returns latencies, errors and wall time.
+    latencies = []
+    errors = []
+    threads = [threading.Thread(target=work, args=(i, latencies, errors)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def timed(latencies, errors, request):
+    started = time.perf_counter()
+    response = request()
+    latencies.append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        errors.append(response.status_code)
+    return response
+
+
+def multiple_weather(app, favourites_per_user=20, clients=10, requests_per_client=20):
+    # Logged-in users whose favourites start without OpenWeatherMap ids, as after they were added;
+    # the first requests resolve them by name, later ones use group fetches and the cache.
+    reset_database(app)
+    with app.app_context():
+        insert_chunked(City.__table__, ({'id': i + 1, 'name': f'Bench City {i}'} for i in range(favourites_per_user)))
+        insert_chunked(User.__table__, ({'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@bench.local',
+                                          'password': 'x', 'email_confirmed': True} for i in range(clients)))
+        insert_chunked(favourites, ({'user_id': u + 1, 'city_id': c + 1}
+                                    for u in range(clients) for c in range(favourites_per_user)))
+        db.session.commit()
+
+    def work(number, latencies, errors):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(number + 1)
+            session['_fresh'] = True
+        for _ in range(requests_per_client):
+            timed(latencies, errors, lambda: client.post('/get_multiple_weather', json={}))
+
+    latencies, errors, elapsed = run_clients(clients, work)
+    return {'latencies': latencies, 'errors': len(errors), 'elapsed': elapsed}
+
+
+def search_city(app, typists=50, keystroke_interval=0.05):
+    # Every typist enters a city name one keystroke at a time; like the page, a query is sent once the
+    # input is longer than two characters. With more typists than CITY_NAMES several type the same name at
+    # once, as real users share popular cities, so coalescing and derived prefix hits both show up.
+    def work(number, latencies, errors):
+        client = app.test_client()
+        name = CITY_NAMES[number % len(CITY_NAMES)]
+        for end in range(3, len(name) + 1):
+            timed(latencies, errors, lambda: client.get('/search_city', query_string={'q': name[:end]}))
+            time.sleep(keystroke_interval)
+
+    latencies, errors, elapsed = run_clients(typists, work)
+    return {'latencies': latencies, 'errors': len(errors), 'elapsed': elapsed}
+
+
+def send_emails_run(app, users=100000, cities=500, drain_limit=10000):
+    # All users are due in the same slot and subscribe to one to three of `cities` cities with known ids.
+    # Seeding is not timed; the notification job and then draining up to `drain_limit` outbox rows are.
+    reset_database(app)
+    with app.app_context():
+        names = [f'Bench City {i}' for i in range(cities)]
+        insert_chunked(City.__table__, ({'id': i + 1, 'name': name, 'owm_id': owm_id(name)}
+                                        for i, name in enumerate(names)))
+        insert_chunked(User.__table__, ({'id': i + 1, 'username': f'user{i}', 'email': f'user{i}@bench.local',
+                                          'password': 'x', 'email_confirmed': True, 'notification_minute': 8 * 60,
+                                          'timezone': 'UTC'} for i in range(users)))
+        insert_chunked(emails, ({'user_id': u + 1, 'city_id': (u * 7 + k * 13) % cities + 1}
+                                for u in range(users) for k in range(1 + u % 3)))
+        db.session.commit()
+
+    log = io.StringIO()
+    with app.app_context(), contextlib.redirect_stdout(log):
+        started = time.perf_counter()
+        report = send_emails(NOTIFICATION_SLOT)
+        enqueue_elapsed = time.perf_counter() - started
+
+        drained = 0
+        started = time.perf_counter()
+        while drained < drain_limit:
+            delivery = drain_outbox()
+            if delivery is None:
+                break
+            drained += delivery['sent']
+        drain_elapsed = time.perf_counter() - started
+
+    return {
+        'users': users,
+        'enqueued': report['enqueued'],
+        'duration': enqueue_elapsed,
+        'timings': report['timings'],
+        'drained': drained,
+        'mail_throughput': drained / drain_elapsed if drain_elapsed else 0.0,
+    }
@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks import scenarios
+from benchmarks.fakes import FakeSMTP, FakeUpstream, geonames, newsapi, openweathermap
+from factory import create_app
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SCENARIOS = ['multiple_weather', 'search_city', 'send_emails']
+# Metrics compared against the baseline and whether a larger value is an improvement.
+HIGHER_IS_BETTER = {'rps': True, 'mail_throughput': True, 'p50': False, 'p95': False, 'p99': False,
+                    'duration': False, 'upstream_calls': False}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile.
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def summarize(result):
+    latencies = sorted(result.pop('latencies'))
+    elapsed = result.pop('elapsed')
+    result.update({
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    })
+    return result
+
+
+def start_fakes(latency, failure_rate, smtp_latency, smtp_failure_rate):
+    providers = {
+        'openweathermap': FakeUpstream(latency, failure_rate, openweathermap).start(),
+        'geonames': FakeUpstream(latency, failure_rate, geonames).start(),
+        'newsapi': FakeUpstream(latency, failure_rate, newsapi).start(),
+    }
+    return providers, FakeSMTP(smtp_latency, smtp_failure_rate).start()
+
+
+def bench_app(providers, smtp, database_path):
+    # Production defaults except for what points at the fakes; a fresh app per scenario also means
+    # empty caches, circuit breakers and quotas.
+    owm = providers['openweathermap'].url
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + database_path,
+        'SECRET_KEY': 'benchmark',
+        'SECURITY_PASSWORD_SALT': 'benchmark',
+        'OWM_BASE_URL': owm + '/data/2.5/weather?',
+        'OWM_FORECAST_URL': owm + '/data/2.5/forecast?',
+        'OWM_GROUP_URL': owm + '/data/2.5/group?',
+        'OWM_API_KEY': 'benchmark',
+        'GEONAMES_URL': providers['geonames'].url + '/searchJSON',
+        'GEONAMES_USERNAME': 'benchmark',
+        'NEWS_URL': providers['newsapi'].url + '/v2/everything',
+        'NEWS_API_KEY': 'benchmark',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': smtp.port,
+        'MAIL_USE_SSL': False,
+        'MAIL_DEFAULT_SENDER': 'weather@bench.local',
+        'MAIL_RETRY_BACKOFF': 0.01,
+        'CITY_INDEX_PATH': None,
+    })
+
+
+def run(names, args):
+    providers, smtp = start_fakes(args.latency, args.failure_rate, args.smtp_latency, args.smtp_failure_rate)
+    database_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    results = {}
+    for name in names:
+        app = bench_app(providers, smtp, database_path)
+        for fake in providers.values():
+            fake.reset()
+        if name == 'multiple_weather':
+            result = summarize(scenarios.multiple_weather(app, args.favourites, args.clients, args.requests))
+        elif name == 'search_city':
+            result = summarize(scenarios.search_city(app, args.typists))
+        else:
+            result = scenarios.send_emails_run(app, args.users, args.cities, args.drain_limit)
+        result['upstream_calls'] = sum(fake.calls for fake in providers.values())
+        result['upstream_calls_by_provider'] = {provider: fake.calls for provider, fake in providers.items()}
+        results[name] = result
+        print(format_result(name, result), flush=True)
+    return results
+
+
+def format_result(name, result):
+    calls = ', '.join(f'{provider} {count}' for provider, count in result['upstream_calls_by_provider'].items() if count)
+    if 'p50' in result:
+        return (f"{name:>16}: {result['requests']} requests, {result['errors']} errors, {result['rps']:8.1f} req/s  "
+                f"p50 {result['p50'] * 1000:7.1f}ms  p95 {result['p95'] * 1000:7.1f}ms  p99 {result['p99'] * 1000:7.1f}ms  "
+                f"upstream calls {result['upstream_calls']} ({calls or 'none'})")
+    stages = ', '.join(f'{stage} {seconds:.2f}s' for stage, seconds in result['timings'].items())
+    return (f"{name:>16}: {result['users']} users, {result['enqueued']} e-mails enqueued in {result['duration']:.2f}s "
+            f"({stages}); {result['drained']} delivered at {result['mail_throughput']:.0f} msg/s  "
+            f"upstream calls {result['upstream_calls']} ({calls or 'none'})")
+
+
+def compare(results, baseline, parameters, tolerance):
+    # Timings may drift by `tolerance` (machines differ); upstream call counts must not grow at all.
+    if baseline.get('parameters') != parameters:
+        print("baseline was recorded with different parameters; run with --save-baseline to replace it")
+        return []
+    regressions = []
+    for name, result in results.items():
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            expected = baseline['results'].get(name, {}).get(metric)
+            if expected is None or metric not in result:
+                continue
+            allowed = 0 if metric == 'upstream_calls' else tolerance
+            if higher_is_better:
+                regressed = result[metric] < expected * (1 - allowed)
+            else:
+                regressed = result[metric] > expected * (1 + allowed)
+            if regressed:
+                regressions.append(f"{name} {metric}: {result[metric]:.4g} (baseline {expected:.4g})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks against local fake providers and SMTP.')
+    parser.add_argument('scenarios', nargs='*', help='any of ' + ', '.join(SCENARIOS) + ' (default: all)')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake provider latency in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='share of provider requests answered with 503')
+    parser.add_argument('--smtp-latency', type=float, default=0.0)
+    parser.add_argument('--smtp-failure-rate', type=float, default=0.0)
+    parser.add_argument('--favourites', type=int, default=20, help='favourite cities per user (multiple_weather)')
+    parser.add_argument('--clients', type=int, default=10, help='concurrent users (multiple_weather)')
+    parser.add_argument('--requests', type=int, default=20, help='requests per user (multiple_weather)')
+    parser.add_argument('--typists', type=int, default=50, help='concurrent typists (search_city)')
+    parser.add_argument('--users', type=int, default=100000, help='seeded subscribers (send_emails)')
+    parser.add_argument('--cities', type=int, default=500, help='seeded cities (send_emails)')
+    parser.add_argument('--drain-limit', type=int, default=10000, help='outbox rows delivered (send_emails)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed timing regression vs the baseline')
+    parser.add_argument('--save-baseline', action='store_true', help=f'store the results in {BASELINE_PATH}')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenario ' + ', '.join(sorted(unknown)))
+    args.scenarios = args.scenarios or SCENARIOS
+
+    parameters = {key: value for key, value in vars(args).items()
+                  if key not in ('scenarios', 'tolerance', 'save_baseline')}
+    results = run(args.scenarios, args)
+
+    if args.save_baseline:
+        baseline = {'parameters': parameters, 'results': results}
+        if os.path.exists(BASELINE_PATH):
+            with open(BASELINE_PATH) as f:
+                previous = json.load(f)
+            if previous.get('parameters') == parameters:
+                baseline['results'] = dict(previous['results'], **results)
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline saved to {BASELINE_PATH}")
+        return
+
+    if not os.path.exists(BASELINE_PATH):
+        print("no baseline yet; run with --save-baseline to record one")
+        return
+    with open(BASELINE_PATH) as f:
+        regressions = compare(results, json.load(f), parameters, args.tolerance)
+    for regression in regressions:
+        print("regression", regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.fakes import FakeUpstream
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_gunicorn(worker_class, workers, fetch_workers, upstream_url, port, **settings):
+    # `settings` are extra environment variables for the app, overriding the ones below.
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite3'),
+               app_secret_key='benchmark', api_key='benchmark',
+               owm_base_url=upstream_url + '/data/2.5/weather?',
+               # Every request goes upstream: no fresh entries, and no expired ones served while refreshing.
+               weather_cache_ttl='0', cache_stale_while_revalidate='0', cache_stale_if_error='0',
+               weather_fetch_workers=str(fetch_workers),
+               web_worker_class=worker_class, WEB_CONCURRENCY=str(workers))
+    env.update(settings)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                '--bind', f'127.0.0.1:{port}', 'app:app'],
+                               cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'gunicorn ({worker_class}) did not start')
+
+
+def run_load(port, clients, requests_per_client, cities):
+    url = f'http://127.0.0.1:{port}/get_multiple_weather'
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        session = requests.Session()
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            session.post(url, json={'cities': cities}, timeout=60)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare gunicorn worker classes on an upstream-bound endpoint.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=5, help='requests per client')
+    parser.add_argument('--latency', type=float, default=0.2, help='fake upstream latency in seconds')
+    parser.add_argument('--fetch-workers', type=int, default=0,
+                        help='weather_fetch_workers per process (default: the app default for the worker class)')
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gevent'])
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args.latency).start()
+    cities = ['Warsaw', 'Krakow', 'Gdansk']
+    print(f"{args.workers} workers, {args.clients} clients x {args.requests} requests, "
+          f"{len(cities)} cities per request, upstream latency {args.latency * 1000:.0f}ms")
+    for worker_class in args.worker_classes:
+        port = free_port()
+        process = start_gunicorn(worker_class, args.workers, args.fetch_workers, upstream.url, port)
+        try:
+            result = run_load(port, args.clients, args.requests, cities)
+        finally:
+            process.terminate()
+            process.wait()
+        print(f"{worker_class:>8}: {result['rps']:7.1f} req/s  p50 {result['p50'] * 1000:7.1f}ms  "
+              f"p95 {result['p95'] * 1000:7.1f}ms  ({result['requests']} requests)")
+    upstream.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_key(name):
+    return ' '.join(str(name).split()).casefold()
+
+
+class MemoryBackend:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    # Shared between gunicorn workers on the same dyno through a local file.
+    def __init__(self, path, namespace, max_size):
+        self.path = path
+        self.namespace = namespace
+        self.max_size = max_size
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache ('
+                         'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+                         'expires_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+                         'PRIMARY KEY (namespace, key))')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (namespace, accessed_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute('SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?',
+                           (self.namespace, key)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?',
+                     (time.time(), self.namespace, key))
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires_at):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?, ?)',
+                     (self.namespace, key, json.dumps(value), expires_at, time.time()))
+        conn.execute('DELETE FROM cache WHERE namespace = ? AND key IN ('
+                     'SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+                     (self.namespace, self.namespace, self.max_size))
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache WHERE namespace = ?', (self.namespace,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM cache WHERE namespace = ?',
+                                          (self.namespace,)).fetchone()[0]
+
+
+class SingleFlight:
+    # Concurrent calls for the same key share the result of a single in-flight call.
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'value': None, 'error': None}
+            else:
+                self.coalesced += 1
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['value']
+        try:
+            call['value'] = fn()
+            return call['value']
+        except Exception as e:
+            call['error'] = e  # followers fail the same way instead of getting None
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+class TTLCache:
+    # Expired entries are kept for max(stale_while_revalidate, stale_if_error) seconds: within the first
+    # window they are served while one background refresh runs, within the second they are served when
+    # the upstream fetch fails.
+    def __init__(self, backend, ttl, stale_while_revalidate=0, stale_if_error=0):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_if_error = stale_if_error
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.stale_if_error_hits = 0
+        self.background_refreshes = 0
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _entry(self, key):
+        # Returns (value, seconds past expiry) for entries still within the stale retention window.
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        expired_for = time.time() - entry[1]
+        if expired_for > max(self.stale_while_revalidate, self.stale_if_error):
+            self.backend.delete(key)
+            return None
+        return entry[0], expired_for
+
+    def get(self, key):
+        entry = self._entry(normalize_key(key))
+        if entry is not None and entry[1] < 0:
+            self._count('hits')
+            return entry[0]
+        self._count('misses')
+        return None
+
+    def expires_in(self, key):
+        # Remaining freshness in seconds without touching the hit/miss counters; None when absent.
+        entry = self.backend.get(normalize_key(key))
+        return None if entry is None else entry[1] - time.time()
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.backend.set(normalize_key(key), value, time.time() + ttl)
+
+    def _fetch(self, key, fetch, ttl):
+        def fetch_and_store():
+            value = fetch()
+            if value is not None and 'error' not in value:
+                self.set(key, value, ttl)
+            return value
+        return self.flights.do(key, fetch_and_store)
+
+    def _refresh_in_background(self, key, fetch, ttl):
+        if self.flights.in_flight(key):
+            return
+        self._count('background_refreshes')
+        threading.Thread(target=self._fetch, args=(key, fetch, ttl), daemon=True).start()
+
+    def get_or_set(self, key, fetch, ttl=None):
+        # Results containing an 'error' key are returned but never cached.
+        key = normalize_key(key)
+        entry = self._entry(key)
+        if entry is not None:
+            value, expired_for = entry
+            if expired_for < 0:
+                self._count('hits')
+                return value
+            if expired_for <= self.stale_while_revalidate:
+                self._count('stale_hits')
+                self._refresh_in_background(key, fetch, ttl)
+                return value
+        self._count('misses')
+        fetched = self._fetch(key, fetch, ttl)
+        if (fetched is None or 'error' in fetched) and entry is not None and entry[1] <= self.stale_if_error:
+            self._count('stale_if_error_hits')
+            return entry[0]
+        return fetched
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        total = self.hits + self.misses + self.stale_hits
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'stale_if_error_hits': self.stale_if_error_hits,
+            'background_refreshes': self.background_refreshes,
+            'coalesced': self.flights.coalesced,
+            'hit_rate': round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+            'size': len(self.backend),
+            'max_size': self.backend.max_size,
+            'ttl': self.ttl,
+        }
+
+
+def create_cache(config, namespace, ttl=None, stale_if_error=None):
+    max_size = int(config.get('WEATHER_CACHE_MAX_SIZE', 1024))
+    ttl = int(config.get('WEATHER_CACHE_TTL', 600)) if ttl is None else ttl
+    stale_if_error = int(config.get('CACHE_STALE_IF_ERROR', 0)) if stale_if_error is None else stale_if_error
+    if config.get('WEATHER_CACHE_BACKEND', 'memory') == 'sqlite':
+        path = config.get('WEATHER_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'weatherapp-cache.sqlite3')
+        backend = SQLiteBackend(path, namespace, max_size)
+    else:
+        backend = MemoryBackend(max_size)
+    return TTLCache(backend, ttl,
+                    stale_while_revalidate=int(config.get('CACHE_STALE_WHILE_REVALIDATE', 0)),
+                    stale_if_error=stale_if_error)
+
+
+class RecentKeys:
+    # Remembers the last `max_size` keys asked for, with the original (un-normalized) value and when.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, value):
+        key = normalize_key(value)
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def recent(self, max_age):
+        # Most recently used first.
+        oldest = time.time() - max_age
+        with self._lock:
+            return [value for value, seen_at in reversed(self._entries.values()) if seen_at >= oldest]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Refresher:
+    # Runs `refresh` every `interval` seconds on a daemon thread that is only started on first use,
+    # i.e. inside the forked web worker rather than in the gunicorn master.
+    def __init__(self, name):
+        self.name = name
+        self.runs = 0
+        self.refreshed = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, refresh, interval):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, args=(refresh, interval), name=self.name, daemon=True)
+                self._thread.start()
+
+    def _run(self, refresh, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.refreshed += refresh()
+            except Exception as e:
+                print("error", self.name, str(e))
+            self.runs += 1
+
+    def stats(self):
+        return {'running': self._thread is not None, 'runs': self.runs, 'refreshed': self.refreshed}
+
+
+class PrefixCache:
+    # Caches population-ordered prefix search results. A longer query is answered from a cached shorter
+    # prefix when that result set was complete, or when filtering it still leaves `limit` results: any
+    # match missing from a population-ordered top-N ranks below everything that was returned.
+    def __init__(self, normalize, max_size, ttl, stale_if_error=0):
+        self.normalize = normalize
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_if_error = stale_if_error
+        self.hits = 0
+        self.derived_hits = 0
+        self.misses = 0
+        self.stale_if_error_hits = 0
+        self.flights = SingleFlight()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            if entry[2] + self.stale_if_error <= now:
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_stale(self, query, limit):
+        # Expired exact-match results still within the stale-if-error window, for upstream outages.
+        with self._lock:
+            entry = self._entries.get(self.normalize(query))
+            if entry is None or entry[2] + self.stale_if_error <= time.time():
+                return None
+            self.stale_if_error_hits += 1
+            return entry[0][:limit]
+
+    def get(self, query, limit):
+        key = self.normalize(query)
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry[0][:limit]
+            for end in range(len(key) - 1, 0, -1):
+                entry = self._lookup(key[:end], now)
+                if entry is None:
+                    continue
+                results, complete, _ = entry
+                matching = [r for r in results if any(name.startswith(key) for name in r['names'])]
+                if complete or len(matching) >= limit:
+                    self.derived_hits += 1
+                    return matching[:limit]
+            self.misses += 1
+            return None
+
+    def set(self, query, results, complete):
+        with self._lock:
+            self._entries[self.normalize(query)] = (results, complete, time.time() + self.ttl)
+            self._entries.move_to_end(self.normalize(query))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.derived_hits + self.misses
+        return {
+            'hits': self.hits,
+            'derived_hits': self.derived_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.derived_hits) / total, 4) if total else 0.0,
+            'upstream_calls_saved': self.hits + self.derived_hits + self.flights.coalesced,
+            'coalesced': self.flights.coalesced,
+            'stale_if_error_hits': self.stale_if_error_hits,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+        }
@@ -1,4 +1,6 @@
-from app import app, db, User, City  # make sure to import your db and User model
+from app import app
+from extensions import db
+from models import User, City  # make sure to import your db and User model
 
 with app.app_context():
     users = User.query.all()
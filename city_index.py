@@ -0,0 +1,203 @@
+import argparse
+import bisect
+import heapq
+import mmap
+import os
+import struct
+import unicodedata
+from collections import Counter
+
+# File layout (little endian):
+#   header: magic, record/key/prefix counts and the offsets of the three offset tables
+#   records: u32 population, u16 length, "name, admin1, country" utf-8
+#   keys:    u32 record id, u16 length, normalized name utf-8 (sorted bytewise)
+#   prefixes: u16 length, prefix utf-8, u8 count, count x u32 record ids (sorted bytewise)
+# Prefixes matching more than PREFIX_THRESHOLD keys have their top results precomputed,
+# every other prefix is answered by scanning at most PREFIX_THRESHOLD keys.
+MAGIC = b'WCI1'
+HEADER = struct.Struct('<4sIIIIII')
+U32 = struct.Struct('<I')
+RECORD = struct.Struct('<IH')
+KEY = struct.Struct('<IH')
+U16 = struct.Struct('<H')
+PREFIX_THRESHOLD = 32
+TOP_RESULTS = 5
+
+
+def fold(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split()).casefold()
+
+
+def normalize(name):
+    return fold(name.split(',')[0])
+
+
+def city_key(name):
+    # Identity of a stored city: case, accents and spacing are ignored in every comma-separated part,
+    # so "Kraków" and " krakow" are one city while "Paris, Texas" and "Paris" stay apart.
+    return ', '.join(part for part in map(fold, name.split(',')) if part)
+
+
+class CityIndex:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_records, self.n_keys, self.n_prefixes, self._records_at, self._keys_at, self._prefixes_at = \
+            HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a city index')
+
+    @classmethod
+    def open(cls, path):
+        if not path or not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def _offset(self, table_at, i):
+        return U32.unpack_from(self._buf, table_at + 4 * i)[0]
+
+    def _record(self, record_id):
+        offset = self._offset(self._records_at, record_id)
+        population, length = RECORD.unpack_from(self._buf, offset)
+        start = offset + RECORD.size
+        return population, self._buf[start:start + length].decode()
+
+    def _key(self, i):
+        offset = self._offset(self._keys_at, i)
+        record_id, length = KEY.unpack_from(self._buf, offset)
+        start = offset + KEY.size
+        return self._buf[start:start + length], record_id
+
+    def _prefix(self, i):
+        offset = self._offset(self._prefixes_at, i)
+        length = U16.unpack_from(self._buf, offset)[0]
+        start = offset + U16.size
+        return self._buf[start:start + length], start + length
+
+    def _precomputed(self, prefix):
+        lo, hi = 0, self.n_prefixes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._prefix(mid)[0] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n_prefixes:
+            return None
+        key, end = self._prefix(lo)
+        if key != prefix:
+            return None
+        count = self._buf[end]
+        return [U32.unpack_from(self._buf, end + 1 + 4 * i)[0] for i in range(count)]
+
+    def _scan(self, prefix):
+        lo, hi = 0, self.n_keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid)[0] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        record_ids = set()
+        for i in range(lo, self.n_keys):
+            key, record_id = self._key(i)
+            if not key.startswith(prefix):
+                break
+            record_ids.add(record_id)
+        return record_ids
+
+    def search(self, query, limit=TOP_RESULTS):
+        prefix = normalize(query).encode()
+        if not prefix:
+            return []
+        record_ids = self._precomputed(prefix)
+        if record_ids is None:
+            record_ids = self._scan(prefix)
+        records = sorted((self._record(record_id) for record_id in record_ids), key=lambda r: -r[0])
+        return [display for _, display in records[:limit]]
+
+
+def read_names(path, key_column, name_column):
+    names = {}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('#'):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) > max(key_column, name_column):
+                    names[columns[key_column]] = columns[name_column]
+    return names
+
+
+def build_index(cities_path, output_path, admin1_path=None, countries_path=None):
+    # cities_path is a GeoNames dump such as cities15000.txt; admin1CodesASCII.txt and countryInfo.txt
+    # turn admin1/country codes into the names the GeoNames search API returns.
+    admin1_names = read_names(admin1_path, 0, 1)
+    country_names = read_names(countries_path, 0, 4)
+
+    records = []
+    keys = []
+    with open(cities_path, encoding='utf-8') as f:
+        for line in f:
+            columns = line.rstrip('\n').split('\t')
+            name, ascii_name, country, admin1 = columns[1], columns[2], columns[8], columns[10]
+            population = int(columns[14] or 0)
+            admin1_name = admin1_names.get(f'{country}.{admin1}', admin1)
+            display = f"{name}, {admin1_name}, {country_names.get(country, country)}"
+            record_id = len(records)
+            records.append((min(population, 2 ** 32 - 1), display.encode()))
+            for key in {normalize(name), normalize(ascii_name)}:
+                if key:
+                    keys.append((key.encode(), record_id))
+    keys.sort(key=lambda k: (k[0], -records[k[1]][0]))
+
+    prefix_counts = Counter()
+    for key, _ in keys:
+        for end in range(1, len(key) + 1):
+            prefix_counts[key[:end]] += 1
+    sorted_keys = [key for key, _ in keys]
+    prefixes = []
+    for prefix in sorted(p for p, count in prefix_counts.items() if count > PREFIX_THRESHOLD):
+        lo = bisect.bisect_left(sorted_keys, prefix)
+        hi = lo + prefix_counts[prefix]
+        record_ids = {record_id for _, record_id in keys[lo:hi]}
+        top = heapq.nlargest(TOP_RESULTS, record_ids, key=lambda record_id: records[record_id][0])
+        prefixes.append((prefix, top))
+
+    record_blobs = [RECORD.pack(population, len(display)) + display for population, display in records]
+    key_blobs = [KEY.pack(record_id, len(key)) + key for key, record_id in keys]
+    prefix_blobs = [U16.pack(len(prefix)) + prefix + bytes([len(top)]) + b''.join(U32.pack(r) for r in top)
+                    for prefix, top in prefixes]
+
+    with open(output_path + '.tmp', 'wb') as out:
+        position = HEADER.size
+        tables = []
+        for blobs in (record_blobs, key_blobs, prefix_blobs):
+            table_at = position
+            position += 4 * len(blobs)
+            offsets = []
+            for blob in blobs:
+                offsets.append(position)
+                position += len(blob)
+            tables.append((table_at, offsets, blobs))
+        out.write(HEADER.pack(MAGIC, len(record_blobs), len(key_blobs), len(prefix_blobs),
+                              tables[0][0], tables[1][0], tables[2][0]))
+        for _, offsets, blobs in tables:
+            out.write(b''.join(U32.pack(offset) for offset in offsets))
+            out.write(b''.join(blobs))
+    os.replace(output_path + '.tmp', output_path)
+    return len(records), len(keys), len(prefixes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the /search_city prefix index from a GeoNames dump.')
+    parser.add_argument('cities', help='GeoNames cities dump, e.g. cities15000.txt')
+    parser.add_argument('--admin1', help='GeoNames admin1CodesASCII.txt')
+    parser.add_argument('--countries', help='GeoNames countryInfo.txt')
+    parser.add_argument('--output', default='city_index.bin')
+    args = parser.parse_args()
+    n_records, n_keys, n_prefixes = build_index(args.cities, args.output, args.admin1, args.countries)
+    print(f"{args.output}: {n_records} cities, {n_keys} keys, {n_prefixes} precomputed prefixes")
@@ -0,0 +1,108 @@
+import os
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class Config:
+    #config = configparser.ConfigParser()
+    #config.read('config.ini')
+    SECRET_KEY = os.environ.get('app_secret_key')#, config['DEFAULT']['app_secret_key'])
+    PERMANENT_SESSION_LIFETIME = timedelta(minutes=5)
+    SQLALCHEMY_DATABASE_URI = (os.environ.get('DATABASE_URL') or '').replace('postgres://', 'postgresql://') or None #, config['DEFAULT']['DATABASE_URL']).replace('postgres://', 'postgresql://')
+    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    # Postgres connection pool per process; see factory.create_app.
+    DB_POOL_SIZE = int(os.environ.get('db_pool_size', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('db_max_overflow', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('db_pool_timeout', 10))
+
+    SCHEDULER_API_ENABLED = True
+    SCHEDULER_TIMEZONE = 'utc'
+
+    MAIL_SERVER = os.environ.get('mail_server', 'smtp.poczta.onet.pl')
+    MAIL_PORT = int(os.environ.get('mail_port', 465))
+    MAIL_USERNAME = os.environ.get('wp_email')#, config['DEFAULT']['wp_email'])
+    MAIL_DEFAULT_SENDER = os.environ.get('wp_email')#, config['DEFAULT']['wp_email'])
+    MAIL_PASSWORD = os.environ.get('wp_password')#, config['DEFAULT']['wp_password'])
+    MAIL_USE_TLS = False
+    MAIL_USE_SSL = os.environ.get('mail_use_ssl', 'true').lower() == 'true'
+    MAIL_BATCH_SIZE = int(os.environ.get('mail_batch_size', 50))
+    MAIL_CONNECTIONS = int(os.environ.get('mail_connections', 2))
+    MAIL_RETRIES = int(os.environ.get('mail_retries', 3))
+    MAIL_RETRY_BACKOFF = float(os.environ.get('mail_retry_backoff', 1.0))
+    MAIL_TIMEOUT = float(os.environ.get('mail_timeout', 10))
+    NOTIFICATION_SLOT_MINUTES = int(os.environ.get('notification_slot_minutes', 15))
+    SCHEDULER_LEASE_SECONDS = int(os.environ.get('scheduler_lease_seconds', 60))
+    OUTBOX_CLAIM_SIZE = int(os.environ.get('outbox_claim_size', 200))
+    OUTBOX_LEASE_SECONDS = int(os.environ.get('outbox_lease_seconds', 300))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('outbox_max_attempts', 5))
+    OUTBOX_RETRY_BACKOFF = int(os.environ.get('outbox_retry_backoff', 60))
+    OUTBOX_POLL_INTERVAL = float(os.environ.get('outbox_poll_interval', 5))
+    SUBSCRIBER_CHUNK_SIZE = int(os.environ.get('subscriber_chunk_size', 1000))
+    CITY_INDEX_PATH = os.environ.get('city_index_path', os.path.join(ROOT, 'city_index.bin'))
+    CACHE_STALE_WHILE_REVALIDATE = int(os.environ.get('cache_stale_while_revalidate', 300))
+    CACHE_STALE_IF_ERROR = int(os.environ.get('cache_stale_if_error', 3600))
+    NEWS_CACHE_TTL = int(os.environ.get('news_cache_ttl', 1800))
+    NEWS_STALE_IF_ERROR = int(os.environ.get('news_stale_if_error', 86400))
+    NEWS_WINDOW_DAYS = int(os.environ.get('news_window_days', 7))
+    NEWS_SORT_BY = os.environ.get('news_sort_by', 'publishedAt')
+    # Web processes per dyno, as gunicorn.conf.py reads it, and web dynos (Heroku does not tell a dyno how many
+    # there are); per-process budgets are divided by them.
+    WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 2))
+    WEB_DYNOS = int(os.environ.get('web_dynos', 1))
+    # The NewsAPI account's daily cap; each web process gets NEWS_DAILY_LIMIT // (WEB_CONCURRENCY * WEB_DYNOS).
+    NEWS_DAILY_LIMIT = int(os.environ.get('news_daily_limit', 100))
+    NEWS_REFRESH_INTERVAL = int(os.environ.get('news_refresh_interval', 300))
+    NEWS_REFRESH_WINDOW = int(os.environ.get('news_refresh_window', 3600))
+    NEWS_REFRESH_MAX_CITIES = int(os.environ.get('news_refresh_max_cities', 100))
+    NEWS_REFRESH_RESERVE = int(os.environ.get('news_refresh_reserve', 10))
+    WEATHER_STREAM_INTERVAL = int(os.environ.get('weather_stream_interval', 60))
+    WEATHER_STREAM_HEARTBEAT = int(os.environ.get('weather_stream_heartbeat', 15))
+    WEATHER_STREAM_MAX_AGE = int(os.environ.get('weather_stream_max_age', 600))
+    SEARCH_CITY_CACHE_TTL = int(os.environ.get('search_city_cache_ttl', 86400))
+    SEARCH_CITY_CACHE_MAX_SIZE = int(os.environ.get('search_city_cache_max_size', 4096))
+    SEARCH_CITY_FETCH_ROWS = int(os.environ.get('search_city_fetch_rows', 20))
+    UPSTREAM_POOL_MAXSIZE = int(os.environ.get('upstream_pool_maxsize', 50))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('upstream_connect_timeout', 3.05))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('upstream_read_timeout', 10))
+    UPSTREAM_RETRIES = int(os.environ.get('upstream_retries', 2))
+    UPSTREAM_RETRY_BACKOFF = float(os.environ.get('upstream_retry_backoff', 0.2))
+    UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('upstream_breaker_threshold', 5))
+    UPSTREAM_BREAKER_RESET = float(os.environ.get('upstream_breaker_reset', 30))
+    PREWARM_CITIES = int(os.environ.get('prewarm_cities', 50))
+    PREWARM_INTERVAL_MINUTES = int(os.environ.get('prewarm_interval_minutes', 10))
+    PREWARM_CALLS_PER_MINUTE = int(os.environ.get('prewarm_calls_per_minute', 30))
+    QUERY_COUNT_HEADER = os.environ.get('query_count_header', 'false').lower() == 'true'
+    PASSWORD_HASH_METHOD = os.environ.get('password_hash_method', 'scrypt')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('password_hash_workers', 1))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('password_hash_max_pending', 4))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('password_hash_timeout', 5))
+    PASSWORD_HASH_NICE = int(os.environ.get('password_hash_nice', 10))
+    METRICS_TOKEN = os.environ.get('metrics_token')
+    METRICS_DIR = os.environ.get('metrics_dir')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('metrics_flush_interval', 5))
+    METRICS_PUBLIC = os.environ.get('metrics_public', 'false').lower() == 'true'
+    METRICS_SNAPSHOT_MAX_AGE = int(os.environ.get('metrics_snapshot_max_age', 300))
+    PROFILE_SLOW_REQUESTS = float(os.environ.get('profile_slow_requests', 0))
+    PROFILE_INTERVAL = float(os.environ.get('profile_interval', 0.005))
+    PROFILE_DIR = os.environ.get('profile_dir', os.path.join(ROOT, 'profiles'))
+    SECURITY_PASSWORD_SALT = os.environ.get('security_password_salt')#, config['DEFAULT']['SECURITY_PASSWORD_SALT'])
+
+    OWM_BASE_URL = os.environ.get('owm_base_url', "http://api.openweathermap.org/data/2.5/weather?")
+    OWM_FORECAST_URL = os.environ.get('owm_forecast_url', "http://api.openweathermap.org/data/2.5/forecast?")
+    OWM_GROUP_URL = os.environ.get('owm_group_url', "http://api.openweathermap.org/data/2.5/group?")
+    OWM_API_KEY = os.environ.get('api_key')#, config['DEFAULT']['api_key'])
+    GEONAMES_URL = os.environ.get('geonames_url', "http://api.geonames.org/searchJSON")
+    GEONAMES_USERNAME = os.environ.get('geonames_username')#, config['DEFAULT']['geonames_username'])
+    NEWS_URL = os.environ.get('news_url', "https://newsapi.org/v2/everything")
+    NEWS_API_KEY = os.environ.get('news_api_key')#, config['DEFAULT']['news_api_key'])
+
+    WEATHER_CACHE_BACKEND = os.environ.get('weather_cache_backend', 'memory')
+    WEATHER_CACHE_PATH = os.environ.get('weather_cache_path')
+    WEATHER_CACHE_TTL = int(os.environ.get('weather_cache_ttl', 600))
+    WEATHER_CACHE_MAX_SIZE = int(os.environ.get('weather_cache_max_size', 1024))
+    # 0 sizes the fetch pool for the process: WEB_WORKER_CONNECTIONS under gevent, 8 threads otherwise.
+    WEATHER_FETCH_WORKERS = int(os.environ.get('weather_fetch_workers', 0))
+    WEB_WORKER_CONNECTIONS = int(os.environ.get('web_worker_connections', 200))
+    WEATHER_FETCH_TIMEOUT = float(os.environ.get('weather_fetch_timeout', 5))
+    DASHBOARD_TIMEOUT = float(os.environ.get('dashboard_timeout', 10))
@@ -1,4 +1,5 @@
-from app import app, db
+from app import app
+from extensions import db
 
 with app.app_context():
     db.create_all()
\ No newline at end of file
@@ -0,0 +1,39 @@
+import click
+from flask import Flask
+
+from config import Config
+from extensions import db, login_manager, mail
+from metrics import metrics
+from services import services
+from views import bp
+
+
+def create_app(config=None):
+    # `config` overrides the environment-derived defaults in config.Config, e.g. for benchmarks.
+    # Upstream clients, caches and the city index are built on first use (see services.py) and the
+    # scheduler only by the worker process (see jobs.py), so creating an app stays cheap.
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    if (app.config['SQLALCHEMY_DATABASE_URI'] or '').startswith('postgresql'):
+        # A gevent worker runs up to web_worker_connections requests at once, far more than SQLAlchemy's default
+        # 5 + 10 connections; greenlets beyond the pool wait up to DB_POOL_TIMEOUT for a free connection.
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict({'pool_size': app.config['DB_POOL_SIZE'],
+                                                        'max_overflow': app.config['DB_MAX_OVERFLOW'],
+                                                        'pool_timeout': app.config['DB_POOL_TIMEOUT'],
+                                                        'pool_pre_ping': True},
+                                                       **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+
+    db.init_app(app)
+    mail.init_app(app)
+    login_manager.init_app(app)
+    services.init_app(app)
+    metrics.init_app(app)
+    # Alembic is only needed by the `flask db` commands, so gunicorn and worker processes never import it.
+    if click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+    app.register_blueprint(bp)
+    return app
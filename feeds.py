@@ -0,0 +1,91 @@
+import threading
+import time
+
+
+def diff(old, new):
+    # Keys whose value changed or appeared, plus None for keys that disappeared (e.g. 'error' once a fetch succeeds).
+    changes = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    changes.update({key: None for key in old if key not in new})
+    return changes
+
+
+class Subscription:
+    # One streaming client. Changes for a city are merged until the client takes them, so a slow or
+    # idle connection holds at most one pending entry per city instead of a growing queue.
+    def __init__(self, cities):
+        self.cities = cities
+        self.pending = {}
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def push(self, city, changes):
+        with self._lock:
+            self.pending.setdefault(city, {}).update(changes)
+        self.ready.set()
+
+    def take(self, timeout):
+        # Returns {city: changes}; empty when nothing changed within `timeout` seconds.
+        self.ready.wait(timeout)
+        self.ready.clear()
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+
+class CityFeed:
+    def __init__(self, city, owm_id):
+        self.city = city
+        self.owm_id = owm_id
+        self.latest = {}
+        self.subscribers = set()
+
+
+class WeatherFeeds:
+    # One refresh loop per city for all of the process's subscribers: every `interval` seconds it reads the
+    # city through `fetch` (the weather cache, so upstream is only called when the entry expires) and pushes
+    # the fields that changed. A loop ends once its city has no subscribers left.
+    def __init__(self, fetch, interval):
+        self.fetch = fetch
+        self.interval = interval
+        self.feeds = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, city_ids):
+        subscription = Subscription(list(city_ids))
+        with self._lock:
+            for city, owm_id in city_ids.items():
+                feed = self.feeds.get(city)
+                if feed is None:
+                    feed = self.feeds[city] = CityFeed(city, owm_id)
+                    threading.Thread(target=self._run, args=(feed,), name=f'weather-feed-{city}', daemon=True).start()
+                elif feed.latest:
+                    subscription.push(city, dict(feed.latest))
+                feed.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for city in subscription.cities:
+                feed = self.feeds.get(city)
+                if feed is not None:
+                    feed.subscribers.discard(subscription)
+
+    def _run(self, feed):
+        while True:
+            try:
+                weather = self.fetch(feed.city, feed.owm_id)
+            except Exception as e:
+                weather = {'error': 'Failed to fetch weather data for ' + feed.city}
+                print("error weather feed", feed.city, str(e))
+            with self._lock:
+                changes = diff(feed.latest, weather)
+                feed.latest = weather
+                subscribers = list(feed.subscribers)
+            if changes:
+                for subscription in subscribers:
+                    subscription.push(feed.city, changes)
+            time.sleep(self.interval)
+            with self._lock:
+                if not feed.subscribers:
+                    del self.feeds[feed.city]
+                    return
@@ -0,0 +1,53 @@
+import time
+from array import array
+from datetime import datetime, timezone
+from itertools import groupby
+
+SLOT_SECONDS = 3 * 60 * 60
+DAY_SECONDS = 24 * 60 * 60
+
+
+def seconds_until_next_slot(now=None):
+    now = time.time() if now is None else now
+    return int(SLOT_SECONDS - now % SLOT_SECONDS) or SLOT_SECONDS
+
+
+def parse_forecast(data):
+    # Columnar view of the 40 three-hourly slots; temperatures are converted from Kelvin to Celsius.
+    slots = data.get('list', [])
+    return {
+        'dt': array('q', (slot['dt'] for slot in slots)),
+        'temp': array('d', (slot['main']['temp'] - 273.15 for slot in slots)),
+        'precipitation': array('d', (slot.get('rain', {}).get('3h', 0.0) + slot.get('snow', {}).get('3h', 0.0)
+                                     for slot in slots)),
+        'wind': array('d', (slot.get('wind', {}).get('speed', 0.0) for slot in slots)),
+    }
+
+
+def daily_summary(columns, utc_offset=0):
+    # Slots are grouped by the city's local calendar day, not by the UTC day.
+    local_days = array('q', ((dt + utc_offset) // DAY_SECONDS for dt in columns['dt']))
+    rows = zip(local_days, columns['temp'], columns['precipitation'], columns['wind'])
+    days = []
+    for day, slots in groupby(rows, key=lambda row: row[0]):
+        _, temps, precipitation, wind = zip(*slots)
+        days.append({
+            'date': datetime.fromtimestamp(day * DAY_SECONDS, tz=timezone.utc).strftime('%Y-%m-%d'),
+            'temp_min': round(min(temps), 2),
+            'temp_max': round(max(temps), 2),
+            'temp_mean': round(sum(temps) / len(temps), 2),
+            'precipitation': round(sum(precipitation), 2),
+            'wind_max': round(max(wind), 2),
+            'wind_mean': round(sum(wind) / len(wind), 2),
+        })
+    return days
+
+
+def summarize_forecast(data):
+    city = data.get('city', {})
+    utc_offset = city.get('timezone', 0)
+    return {
+        'city': city.get('name'),
+        'timezone': utc_offset,
+        'days': daily_summary(parse_forecast(data), utc_offset),
+    }
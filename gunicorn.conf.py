@@ -0,0 +1,16 @@
+import os
+
+# gevent workers serve many concurrent requests per process while they wait on upstream APIs;
+# set web_worker_class=sync to fall back to one request per worker.
+worker_class = os.environ.get('web_worker_class', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_connections = int(os.environ.get('web_worker_connections', 200))
+timeout = int(os.environ.get('web_timeout', 30))
+
+
+def post_fork(server, worker):
+    # psycopg2 is a C extension that gevent cannot patch: without a wait callback every SQL statement would
+    # block the whole worker, not just the greenlet that runs it.
+    if worker_class == 'gevent' and os.environ.get('DATABASE_URL', '').startswith(('postgres://', 'postgresql://')):
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
@@ -0,0 +1,75 @@
+import os
+import socket
+from datetime import datetime, timedelta
+
+from flask_apscheduler import APScheduler
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db
+from metrics import metrics
+from models import SchedulerLease
+from notifications import send_emails
+
+# Only the worker process imports this module; the web app never loads APScheduler.
+scheduler = APScheduler()
+
+
+# APScheduler runs jobs on its own threads, outside any app context.
+def send_emails_task():
+    with scheduler.app.app_context(), metrics.record_job('send_emails') as run:
+        run['items'] = send_emails()['enqueued']
+
+def init_scheduler(app):
+    scheduler.init_app(app)
+    scheduler.add_job(id='send_emails_task', func=send_emails_task, trigger='cron',
+                      minute=f"*/{app.config['NOTIFICATION_SLOT_MINUTES']}", replace_existing=True)
+
+def renew_scheduler_lease(holder, lease_seconds, name='scheduler'):
+    # Takes the lease when it is free or expired and extends it when already held; True means leader.
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=lease_seconds)
+    db.session.execute(insert(SchedulerLease).values(name=name, holder=holder, expires_at=expires_at)
+                       .on_conflict_do_nothing(index_elements=['name']))
+    renewed = SchedulerLease.query \
+        .filter(SchedulerLease.name == name) \
+        .filter(or_(SchedulerLease.holder == holder, SchedulerLease.expires_at < now)) \
+        .update({'holder': holder, 'expires_at': expires_at}, synchronize_session=False)
+    db.session.commit()
+    return renewed == 1
+
+def release_scheduler_lease(holder, name='scheduler'):
+    SchedulerLease.query.filter_by(name=name, holder=holder).delete(synchronize_session=False)
+    db.session.commit()
+
+def run_scheduler(app, stop_event):
+    # Every candidate heartbeats the lease every third of its lifetime. The holder runs the jobs; the others
+    # stand by and take over at most SCHEDULER_LEASE_SECONDS plus one heartbeat after the holder stops renewing.
+    # A leader that cannot renew (e.g. lost its database connection) pauses its jobs straight away.
+    init_scheduler(app)
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    lease_seconds = app.config['SCHEDULER_LEASE_SECONDS']
+    leading = False
+    while True:
+        with app.app_context():
+            try:
+                is_leader = renew_scheduler_lease(holder, lease_seconds)
+            except Exception as e:
+                print("error run_scheduler", str(e))
+                is_leader = False
+            if is_leader and not leading:
+                if scheduler.running:
+                    scheduler.resume()
+                else:
+                    scheduler.start()
+                print("run_scheduler", holder, "became scheduler leader")
+            elif leading and not is_leader:
+                scheduler.pause()
+                print("run_scheduler", holder, "lost scheduler leadership")
+            leading = is_leader
+            if stop_event.wait(lease_seconds / 3):
+                if leading:
+                    scheduler.shutdown(wait=False)
+                    release_scheduler_lease(holder)
+                return
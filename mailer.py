@@ -0,0 +1,102 @@
+import itertools
+import smtplib
+import threading
+import time
+
+
+def _close(conn):
+    try:
+        conn.__exit__(None, None, None)
+    except Exception:
+        pass
+
+
+def connect(mail, timeout):
+    # flask_mail.Connection.configure_host opens smtplib without a timeout, so a hung server would block
+    # the delivery thread forever; this is the same setup with one.
+    conn = mail.connect()
+    state = conn.mail
+    if state.suppress:
+        return conn.__enter__()
+    host = (smtplib.SMTP_SSL if state.use_ssl else smtplib.SMTP)(state.server, state.port, timeout=timeout)
+    host.set_debuglevel(int(state.debug))
+    if state.use_tls:
+        host.starttls()
+    if state.username and state.password:
+        host.login(state.username, state.password)
+    conn.host = host
+    conn.num_emails = 0
+    return conn
+
+
+def worst_case_seconds(retries, backoff, timeout):
+    # Longest a single message can take: every attempt hits the timeout, plus the sleeps between them.
+    return (retries + 1) * timeout + backoff * (2 ** retries - 1)
+
+
+def deliver(app, mail, messages, batch_size=50, connections=2, retries=3, backoff=1.0, timeout=10.0,
+            on_result=None, before_send=None):
+    # `messages` may be a generator; it is consumed one batch at a time so a run never sits in memory.
+    # Each worker thread keeps its own SMTP connection open across batches and reconnects after a failure.
+    # `on_result(msg, error)` is called once per message, with error None when it was sent. A message for
+    # which `before_send(msg)` returns False is skipped without a result.
+    messages = iter(messages)
+    lock = threading.Lock()
+    report = {'sent': 0, 'failed': 0, 'retries': 0, 'batches': 0}
+
+    def next_batch():
+        with lock:
+            batch = list(itertools.islice(messages, batch_size))
+            if batch:
+                report['batches'] += 1
+            return batch
+
+    def record(key):
+        with lock:
+            report[key] += 1
+
+    def send_batches():
+        with app.app_context():
+            conn = None
+            try:
+                while True:
+                    batch = next_batch()
+                    if not batch:
+                        break
+                    for msg in batch:
+                        if before_send is not None and not before_send(msg):
+                            continue
+                        for attempt in range(retries + 1):
+                            try:
+                                if conn is None:
+                                    conn = connect(mail, timeout)
+                                conn.send(msg)
+                                record('sent')
+                                if on_result is not None:
+                                    on_result(msg, None)
+                                break
+                            except Exception as e:
+                                if conn is not None:
+                                    _close(conn)
+                                    conn = None
+                                if attempt == retries:
+                                    record('failed')
+                                    print("error deliver", msg.recipients, str(e))
+                                    if on_result is not None:
+                                        on_result(msg, str(e))
+                                else:
+                                    record('retries')
+                                    time.sleep(backoff * 2 ** attempt)
+            finally:
+                if conn is not None:
+                    _close(conn)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=send_batches, name=f'mail-delivery-{i}') for i in range(max(1, connections))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    report['elapsed'] = time.perf_counter() - started
+    report['throughput'] = report['sent'] / report['elapsed'] if report['elapsed'] else 0.0
+    return report
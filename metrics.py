@@ -0,0 +1,293 @@
+import glob
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, request
+
+INF = float('inf')
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, INF)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, INF)
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, INF)
+
+HELP = {
+    'http_request_duration_seconds': 'Request latency by route, method and status.',
+    'http_request_db_queries': 'SQL statements executed per request.',
+    'http_request_db_seconds': 'Time spent in SQL statements per request.',
+    'upstream_requests_total': 'Upstream API attempts by provider and outcome (HTTP status, error or circuit_open).',
+    'upstream_request_duration_seconds': 'Upstream API attempt latency by provider.',
+    'job_duration_seconds': 'Background job run time.',
+    'job_runs_total': 'Background job runs by status.',
+    'job_items_total': 'Items processed by background jobs (e-mails enqueued or sent, upstream calls).',
+    'password_hash_duration_seconds': 'Password hash or check time, including the wait for a pool process.',
+    'password_hash_rejections_total': 'Password hashes refused because the pool queue was full, timed out or broken.',
+    'slow_request_profiles_total': 'Profiles written for requests slower than profile_slow_requests.',
+}
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_bound(bound):
+    return '+Inf' if bound == INF else repr(float(bound))
+
+
+class Metrics:
+    # Process-wide counters and histograms, rendered in the Prometheus text format by /metrics.
+    # With METRICS_DIR set every gunicorn worker also writes its numbers there every METRICS_FLUSH_INTERVAL
+    # seconds and /metrics adds up all files, so a scrape sees the whole host instead of whichever worker
+    # answered it. Worker dynos publish theirs through the database instead (see worker.py).
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.directory = None
+        self.flush_interval = 5.0
+        self.profiler = None
+        self._flusher_pid = None
+        self._snapshot_name = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if app.config['PROFILE_SLOW_REQUESTS'] > 0:
+            self.profiler = SlowRequestProfiler(app.config['PROFILE_SLOW_REQUESTS'], app.config['PROFILE_INTERVAL'],
+                                                app.config['PROFILE_DIR'])
+        else:
+            self.profiler = None
+        app.before_request(self._start_request)
+        app.after_request(self._remember_status)
+        app.teardown_request(self._record_request)
+        app.extensions['metrics'] = self
+
+    def inc(self, name, labels, value=1):
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+        self._ensure_flusher()
+
+    def observe(self, name, labels, value, buckets=REQUEST_BUCKETS):
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                    'sum': 0.0, 'count': 0}
+            histogram['sum'] += value
+            histogram['count'] += 1
+            for i, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+                    break
+        self._ensure_flusher()
+
+    def observe_job(self, job, duration, items=0, status='ok'):
+        self.observe('job_duration_seconds', {'job': job}, duration, JOB_BUCKETS)
+        self.inc('job_runs_total', {'job': job, 'status': status})
+        self.inc('job_items_total', {'job': job}, items)
+        self.flush()
+
+    @contextmanager
+    def record_job(self, job):
+        # Usage: `with metrics.record_job('send_emails') as run: run['items'] = ...`
+        run = {'items': 0}
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            yield run
+            status = 'ok'
+        finally:
+            self.observe_job(job, time.perf_counter() - started, run['items'], status)
+
+    def _start_request(self):
+        g.request_started = time.perf_counter()
+        if self.profiler is not None:
+            g.profile = self.profiler.start()
+
+    def _remember_status(self, response):
+        g.response_status = response.status_code
+        return response
+
+    def _record_request(self, exc):
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.observe('http_request_duration_seconds',
+                     {'route': route, 'method': request.method, 'status': str(g.get('response_status', 500))},
+                     elapsed)
+        self.observe('http_request_db_queries', {'route': route}, g.get('query_count', 0), QUERY_COUNT_BUCKETS)
+        self.observe('http_request_db_seconds', {'route': route}, g.get('query_time', 0.0))
+        profile = g.pop('profile', None)
+        if profile is not None and self.profiler.finish(profile, elapsed):
+            self.inc('slow_request_profiles_total', {'route': route})
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': labels, 'value': value}
+                             for (name, labels), value in self.counters.items()],
+                'histograms': [dict(histogram, name=name, labels=labels, counts=list(histogram['counts']))
+                               for (name, labels), histogram in self.histograms.items()],
+            }
+
+    def flush(self):
+        if not self.directory:
+            return
+        if self._snapshot_name is None or not self._snapshot_name.startswith(f'{os.getpid()}-'):
+            # Named by pid and start time: a restarted worker must not overwrite the totals of its predecessor.
+            self._snapshot_name = f'{os.getpid()}-{time.time_ns()}.json'
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self._snapshot_name)
+        with self._flush_lock:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+
+    def _ensure_flusher(self):
+        # Started on first use rather than in init_app, so it runs in each forked gunicorn worker.
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print("error metrics flush", str(e))
+
+    def collect(self):
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                pass  # being replaced by its process; its numbers are back on the next scrape
+        return snapshots
+
+    def render(self, extra=()):
+        # `extra` are snapshots of other processes, e.g. worker dynos loaded from the database.
+        counters = {}
+        histograms = {}
+        for snapshot in self.collect() + list(extra):
+            for counter in snapshot['counters']:
+                key = (counter['name'], tuple(map(tuple, counter['labels'])))
+                counters[key] = counters.get(key, 0) + counter['value']
+            for histogram in snapshot['histograms']:
+                key = (histogram['name'], tuple(map(tuple, histogram['labels'])))
+                merged = histograms.setdefault(key, {'buckets': histogram['buckets'],
+                                                     'counts': [0] * len(histogram['buckets']), 'sum': 0.0, 'count': 0})
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], histogram['counts'])]
+                merged['sum'] += histogram['sum']
+                merged['count'] += histogram['count']
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} counter']
+            lines += [f'{name}{format_labels(labels)} {value}'
+                      for (series, labels), value in sorted(counters.items()) if series == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines += [f'# HELP {name} {HELP.get(name, name)}', f'# TYPE {name} histogram']
+            for (series, labels), histogram in sorted(histograms.items()):
+                if series != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", format_bound(bound))])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram["sum"]}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram["count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+class SlowRequestProfiler:
+    # Wall-clock sampling profiler: a real OS thread records the stack of every in-flight request each
+    # `interval` seconds, and requests slower than `threshold` get their samples written to `directory` as
+    # collapsed stacks ("frame;frame;frame count" lines), the input of flamegraph.pl and speedscope.
+    # Under gevent the request's greenlet frame is sampled, so time spent waiting on upstream APIs shows up.
+    def __init__(self, threshold, interval, directory):
+        self.threshold = threshold
+        self.interval = interval
+        self.directory = directory
+        self.active = {}
+        self._sampler_pid = None
+        self._ids = itertools.count()
+        if 'gevent.monkey' in sys.modules and sys.modules['gevent.monkey'].is_module_patched('threading'):
+            from gevent.monkey import get_original
+            import greenlet
+            self._start_thread, self._get_ident = get_original('_thread', ['start_new_thread', 'get_ident'])
+            self._sleep = get_original('time', 'sleep')
+            self._current_greenlet = greenlet.getcurrent
+        else:
+            import _thread
+            self._start_thread, self._get_ident = _thread.start_new_thread, _thread.get_ident
+            self._sleep = time.sleep
+            self._current_greenlet = lambda: None
+
+    def start(self):
+        if self._sampler_pid != os.getpid():
+            self._sampler_pid = os.getpid()
+            self._start_thread(self._sample_forever, ())
+        profile = (next(self._ids), self._get_ident(), self._current_greenlet(), {})
+        self.active[profile[0]] = profile
+        return profile
+
+    def finish(self, profile, elapsed):
+        self.active.pop(profile[0], None)
+        if elapsed < self.threshold:
+            return False
+        samples = dict(profile[3])
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{request.endpoint or 'unmatched'}"
+                                            f"-{elapsed * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            f.writelines(f'{stack} {count}\n' for stack, count in samples.items())
+        print("slow_request", f"{request.method} {request.path} took {elapsed * 1000:.0f}ms,",
+              f"{sum(samples.values())} samples written to {path}")
+        return True
+
+    def _sample_forever(self):
+        while True:
+            self._sleep(self.interval)
+            if not self.active:
+                continue
+            frames = sys._current_frames()
+            for _, ident, greenlet, samples in list(self.active.values()):
+                # A greenlet that is not running keeps its frame in gr_frame; a running one is the thread's frame.
+                frame = greenlet.gr_frame if greenlet is not None else None
+                if frame is None:
+                    frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack = ';'.join(reversed(stack))
+                samples[stack] = samples.get(stack, 0) + 1
+
+
+metrics = Metrics()
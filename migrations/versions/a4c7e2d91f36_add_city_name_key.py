@@ -0,0 +1,73 @@
+"""Add unique normalized name key to city
+
+Revision ID: a4c7e2d91f36
+Revises: e5a09b3c7f12
+Create Date: 2026-10-18 19:21:05.337912
+
+"""
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c7e2d91f36'
+down_revision = 'e5a09b3c7f12'
+branch_labels = None
+depends_on = None
+
+
+# Copy of city_index.city_key as of this revision, so the migration keeps producing the same keys.
+def fold(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split()).casefold()
+
+
+def city_key(name):
+    return ', '.join(part for part in map(fold, name.split(',')) if part)
+
+
+def merge_duplicate_cities(connection):
+    # Rows created by concurrent requests (or spelled differently) collapse into the lowest id; favourites,
+    # e-mail subscriptions and a resolved OpenWeatherMap location move over to it.
+    cities = connection.execute(sa.text('SELECT id, name, owm_id, lat, lon FROM city ORDER BY id')).fetchall()
+    keepers = {}
+    for city in cities:
+        key = city_key(city.name)
+        keeper = keepers.get(key)
+        if keeper is None:
+            keepers[key] = {'id': city.id, 'owm_id': city.owm_id}
+            connection.execute(sa.text('UPDATE city SET name_key = :key WHERE id = :id'), {'key': key, 'id': city.id})
+            continue
+        for table in ('favourites', 'emails'):
+            connection.execute(sa.text(
+                f'INSERT INTO {table} (user_id, city_id) SELECT user_id, :keeper FROM {table} AS duplicate '
+                f'WHERE city_id = :duplicate AND NOT EXISTS '
+                f'(SELECT 1 FROM {table} WHERE user_id = duplicate.user_id AND city_id = :keeper)'),
+                {'keeper': keeper['id'], 'duplicate': city.id})
+            connection.execute(sa.text(f'DELETE FROM {table} WHERE city_id = :duplicate'), {'duplicate': city.id})
+        if keeper['owm_id'] is None and city.owm_id is not None:
+            connection.execute(sa.text('UPDATE city SET owm_id = :owm_id, lat = :lat, lon = :lon WHERE id = :id'),
+                               {'owm_id': city.owm_id, 'lat': city.lat, 'lon': city.lon, 'id': keeper['id']})
+            keeper['owm_id'] = city.owm_id
+        connection.execute(sa.text('DELETE FROM city WHERE id = :id'), {'id': city.id})
+
+
+def upgrade():
+    with op.batch_alter_table('city', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('name_key', sa.String(length=200), nullable=True))
+
+    merge_duplicate_cities(op.get_bind())
+
+    with op.batch_alter_table('city', schema=None) as batch_op:
+        batch_op.alter_column('name_key', existing_type=sa.String(length=200), nullable=False)
+        batch_op.create_index(batch_op.f('ix_city_name_key'), ['name_key'], unique=True)
+
+
+def downgrade():
+    # Merged duplicate cities are not restored.
+    with op.batch_alter_table('city', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_city_name_key'))
+        batch_op.drop_column('name_key')
@@ -0,0 +1,112 @@
+import json
+from datetime import datetime, timedelta
+
+from flask_login import UserMixin
+from sqlalchemy import literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from city_index import city_key
+from extensions import db
+
+favourites = db.Table('favourites',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('city_id', db.Integer, db.ForeignKey('city.id'), primary_key=True)
+)
+
+emails = db.Table('emails',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('city_id', db.Integer, db.ForeignKey('city.id'), primary_key=True)
+)
+
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(150), unique=True, nullable=False)
+    password = db.Column(db.String(220), nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    email_confirmed = db.Column(db.Boolean, nullable=False, default=False)
+    email_confirmed_on = db.Column(db.DateTime, nullable=True)
+    notification_minute = db.Column(db.Integer, nullable=False, default=8 * 60, server_default='480')
+    timezone = db.Column(db.String(64), nullable=False, default='UTC', server_default='UTC', index=True)
+    favorite_cities = db.relationship('City', secondary=favourites, lazy=True,
+                                      backref=db.backref('favourite_users', lazy=True))
+    emails_enabled = db.relationship('City', secondary=emails, lazy=True,
+                                     backref=db.backref('emails_enabled_users', lazy=True))
+
+class City(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # city_key(name); lookups go through its unique index, and spellings of one city share a row.
+    name_key = db.Column(db.String(200), nullable=False, unique=True, index=True,
+                         default=lambda context: city_key(context.get_current_parameters()['name']))
+    owm_id = db.Column(db.Integer, nullable=True)
+    lat = db.Column(db.Float, nullable=True)
+    lon = db.Column(db.Float, nullable=True)
+
+class OutboxEmail(db.Model):
+    # Mail waiting for the worker process. dedup_key makes enqueueing idempotent (one weather e-mail
+    # per user and slot, however many schedulers run); confirmation e-mails leave it empty.
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    dedup_key = db.Column(db.String(200), nullable=True, unique=True)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_until = db.Column(db.DateTime, nullable=True)
+    # Set by the claim that holds the row; write-backs only touch rows whose token still matches.
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.Index('ix_outbox_email_status_available_at', 'status', 'available_at'),)
+
+class SchedulerLease(db.Model):
+    # One row per lease; whoever holds an unexpired lease runs the scheduled jobs.
+    name = db.Column(db.String(64), primary_key=True)
+    holder = db.Column(db.String(200), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class MetricsSnapshot(db.Model):
+    # Latest metrics of a process that serves no HTTP (a worker dyno); web processes add them to /metrics.
+    source = db.Column(db.String(200), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+def save_metrics_snapshot(source, snapshot, max_age):
+    # Replaces this source's row and drops rows of processes that stopped publishing `max_age` seconds ago.
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    now = datetime.utcnow()
+    row = insert(MetricsSnapshot).values(source=source, data=json.dumps(snapshot), updated_at=now)
+    db.session.execute(row.on_conflict_do_update(index_elements=['source'],
+                                                 set_={'data': row.excluded.data, 'updated_at': now}))
+    MetricsSnapshot.query.filter(MetricsSnapshot.updated_at < now - timedelta(seconds=max_age)) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+def load_metrics_snapshots(max_age):
+    since = datetime.utcnow() - timedelta(seconds=max_age)
+    return [json.loads(data) for data, in db.session.query(MetricsSnapshot.data)
+            .filter(MetricsSnapshot.updated_at >= since)]
+
+def add_user_city(association, user_id, name):
+    # Creates the city unless a row with its key exists and links it to the user through `association`
+    # (favourites or emails), in one transaction; False means the link was already there. On PostgreSQL
+    # both upserts are a single statement. The no-op DO UPDATE makes RETURNING yield the existing city id.
+    key = city_key(name)
+    if db.engine.dialect.name == 'postgresql':
+        city = postgresql.insert(City).values(name=name, name_key=key)
+        city = city.on_conflict_do_update(index_elements=['name_key'], set_={'name_key': city.excluded.name_key}) \
+            .returning(City.id).cte('city_upsert')
+        link = postgresql.insert(association).from_select(['user_id', 'city_id'], select(literal(user_id), city.c.id)) \
+            .on_conflict_do_nothing().returning(association.c.city_id)
+        added = db.session.execute(link).first() is not None
+    else:
+        city = sqlite.insert(City).values(name=name, name_key=key)
+        city_id = db.session.execute(city.on_conflict_do_update(index_elements=['name_key'],
+                                                                set_={'name_key': city.excluded.name_key})
+                                     .returning(City.id)).scalar_one()
+        added = db.session.execute(sqlite.insert(association).values(user_id=user_id, city_id=city_id)
+                                   .on_conflict_do_nothing()).rowcount == 1
+    db.session.commit()
+    return added
@@ -0,0 +1,254 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import groupby, islice
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from flask import current_app, render_template, url_for
+from flask_mail import Message
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import and_, false, or_, true
+from sqlalchemy.dialects import postgresql, sqlite
+
+from extensions import db, mail
+from mailer import deliver, worst_case_seconds
+from models import City, OutboxEmail, User, emails
+from weather import get_weather_data, get_weather_data_many, store_city_locations
+
+
+def generate_confirmation_token(email):
+    serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+    return serializer.dumps(email, salt=current_app.config['SECURITY_PASSWORD_SALT'])
+
+def confirm_token(token, expiration=3600):
+    serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+    try:
+        email = serializer.loads(token, salt=current_app.config['SECURITY_PASSWORD_SALT'], max_age=expiration)
+    except:
+        return False
+    return email
+
+def send_email_verification_email(email):
+    token = generate_confirmation_token(email)
+    confirm_url = url_for('main.confirm_email', token=token, _external=True)
+    html = render_template('email_confirmation.html', confirm_url=confirm_url)
+    subject = "Please confirm your email"
+    enqueue_email(email, subject, html)
+    db.session.commit()
+
+def notification_slot_start(now=None):
+    now = now or datetime.now(timezone.utc)
+    slot_minutes = current_app.config['NOTIFICATION_SLOT_MINUTES']
+    return now.replace(minute=now.minute - now.minute % slot_minutes, second=0, microsecond=0)
+
+def due_users_filter(slot_start):
+    # Users whose local notification time falls inside [slot_start, slot_start + slot) in their own
+    # timezone. Evaluated per distinct timezone so DST is handled by zoneinfo, not by stored offsets.
+    slot_minutes = current_app.config['NOTIFICATION_SLOT_MINUTES']
+    conditions = []
+    for (tz_name,) in db.session.query(User.timezone).distinct():
+        try:
+            local_start = slot_start.astimezone(ZoneInfo(tz_name))
+        except (ZoneInfoNotFoundError, ValueError):
+            continue
+        first_minute = local_start.hour * 60 + local_start.minute
+        conditions.append(and_(User.timezone == tz_name,
+                               User.notification_minute >= first_minute,
+                               User.notification_minute < first_minute + slot_minutes))
+    return or_(*conditions) if conditions else false()
+
+def get_users_and_cities(chunk_size=1000, due_filter=None):
+    # One join over user/emails/city streamed in chunks; the query runs here, in the caller's session,
+    # and the returned generator yields (email, [city names]) per confirmed subscriber.
+    rows = db.session.query(User.email, City.name) \
+        .join(emails, emails.c.user_id == User.id) \
+        .join(City, City.id == emails.c.city_id) \
+        .filter(User.email_confirmed) \
+        .filter(due_filter if due_filter is not None else true()) \
+        .order_by(User.id) \
+        .yield_per(chunk_size)
+    return ((email, [row.name for row in group]) for email, group in groupby(rows, key=lambda row: row.email))
+
+def get_subscribed_cities(due_filter=None):
+    query = db.session.query(City.name, City.owm_id) \
+        .join(emails, emails.c.city_id == City.id) \
+        .join(User, User.id == emails.c.user_id) \
+        .filter(User.email_confirmed) \
+        .filter(due_filter if due_filter is not None else true()) \
+        .distinct()
+    return {name: owm_id for name, owm_id in query}
+
+def generate_email_body(cities, weather_snapshot=None):
+    email_body = f"<p>Dear User,</p><p>Here is the weather update for your cities:</p>"
+
+    for city in cities:
+        if weather_snapshot is None:
+            weather = get_weather_data(city)
+        else:
+            weather = weather_snapshot.get(city, {'error': 'Missing from snapshot'})
+        if 'error' not in weather:
+            email_body += f"<p>- {weather['city']}: {weather['temperature']}°C, {weather['description']}</p>"
+        else:
+            email_body += f"<p>- Couldn't retrieve weather information for {city}</p>"
+
+    email_body += "<p>Best regards,<br>Your WeatherApp Team</p>"
+    return email_body
+
+def weather_notification_rows(subscribers, weather_snapshot, slot_start, timings):
+    for email, cities in subscribers:
+        stage_start = time.perf_counter()
+        body = generate_email_body(cities, weather_snapshot)
+        timings['render'] += time.perf_counter() - stage_start
+        yield {'recipient': email, 'subject': "Your Assigned Cities", 'html': body,
+               'dedup_key': f"weather:{email}:{slot_start:%Y-%m-%dT%H:%M}"}
+
+def send_emails(slot_start=None):
+    # Runs every NOTIFICATION_SLOT_MINUTES and only handles the users due in the current slot.
+    # Stages: distinct subscribed cities -> one concurrent fetch per city -> render from the snapshot into
+    # the outbox, which the worker process drains.
+    config = current_app.config
+    slot_start = slot_start or notification_slot_start()
+    timings = {}
+    stage_start = time.perf_counter()
+    due_filter = due_users_filter(slot_start)
+    city_ids = get_subscribed_cities(due_filter)
+    cities = list(city_ids)
+    timings['collect_cities'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    weather_snapshot = dict(zip(cities, get_weather_data_many(cities, city_ids)))
+    store_city_locations({city: weather_snapshot[city] for city in cities if city_ids[city] is None})
+    timings['fetch_weather'] = time.perf_counter() - stage_start
+
+    timings['render'] = 0.0
+    stage_start = time.perf_counter()
+    rows = weather_notification_rows(get_users_and_cities(config['SUBSCRIBER_CHUNK_SIZE'], due_filter),
+                                     weather_snapshot, slot_start, timings)
+    enqueued = 0
+    while True:
+        batch = list(islice(rows, config['MAIL_BATCH_SIZE']))
+        if not batch:
+            break
+        enqueued += enqueue_outbox_rows(batch)
+    db.session.commit()
+    timings['enqueue'] = time.perf_counter() - stage_start - timings['render']
+
+    print("send_emails", f"slot {slot_start:%H:%M} UTC, {len(cities)} distinct cities, {enqueued} e-mails enqueued,",
+          ", ".join(f"{stage}={seconds:.3f}s" for stage, seconds in timings.items()))
+    return {'slot': slot_start.isoformat(), 'cities': len(cities), 'enqueued': enqueued, 'timings': timings}
+
+def enqueue_email(to, subject, template, dedup_key=None):
+    db.session.add(OutboxEmail(recipient=to, subject=subject, html=template, dedup_key=dedup_key))
+
+def enqueue_outbox_rows(rows):
+    # Bulk insert that silently skips rows whose dedup_key is already queued.
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    now = datetime.utcnow()
+    rows = [dict(row, status='pending', attempts=0, available_at=now, created_at=now) for row in rows]
+    result = db.session.execute(insert(OutboxEmail).values(rows).on_conflict_do_nothing(index_elements=['dedup_key']))
+    return result.rowcount
+
+def claim_outbox_batch(batch_size, lease_seconds):
+    # FOR UPDATE SKIP LOCKED lets any number of workers claim disjoint batches; the lease hands
+    # rows of a crashed worker back to the others once it expires. Returns the claim token and the rows.
+    token = uuid.uuid4().hex
+    now = datetime.utcnow()
+    rows = OutboxEmail.query \
+        .filter(OutboxEmail.available_at <= now) \
+        .filter(or_(OutboxEmail.status == 'pending',
+                    and_(OutboxEmail.status == 'sending', OutboxEmail.locked_until < now))) \
+        .order_by(OutboxEmail.id) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    claimed = []
+    for row in rows:
+        row.status = 'sending'
+        row.locked_until = now + timedelta(seconds=lease_seconds)
+        row.claim_token = token
+        row.attempts += 1
+        claimed.append((row.id, row.recipient, row.subject, row.html, row.attempts))
+    db.session.commit()
+    return token, claimed
+
+class OutboxClaim:
+    # Keeps the lease on a claim's rows while its messages are sent. Before each message it makes sure at
+    # least `min_remaining` seconds of lease are left, renewing every row still under the token in one
+    # statement when they are not. Rows another worker took over after an expired lease carry a different
+    # token and are skipped, so a message is never sent twice.
+    def __init__(self, token, lease_seconds, min_remaining):
+        self.token = token
+        self.lease_seconds = lease_seconds
+        self.min_remaining = min_remaining
+        self.renewed_at = time.monotonic()
+        self.held = None
+        self._lock = threading.Lock()
+
+    def hold(self, outbox_id):
+        with self._lock:
+            if self.held is None or time.monotonic() - self.renewed_at > self.lease_seconds - self.min_remaining:
+                self._renew()
+            return outbox_id in self.held
+
+    def _renew(self):
+        renewed_at = time.monotonic()
+        rows = OutboxEmail.query.filter_by(claim_token=self.token, status='sending')
+        rows.update({'locked_until': datetime.utcnow() + timedelta(seconds=self.lease_seconds)},
+                    synchronize_session=False)
+        self.held = {outbox_id for outbox_id, in rows.with_entities(OutboxEmail.id)}
+        db.session.commit()
+        self.renewed_at = renewed_at
+
+def outbox_messages(claimed):
+    for outbox_id, recipient, subject, html, _ in claimed:
+        msg = Message(subject, recipients=[recipient], html=html)
+        msg.outbox_id = outbox_id
+        yield msg
+
+def outbox_lease_seconds(config):
+    # A message must never outlive the lease it was started under, so the lease is at least twice the
+    # longest one message can take; renewals then happen well before it runs out.
+    per_message = worst_case_seconds(config['MAIL_RETRIES'], config['MAIL_RETRY_BACKOFF'], config['MAIL_TIMEOUT'])
+    return per_message, max(config['OUTBOX_LEASE_SECONDS'], 2 * per_message)
+
+def drain_outbox():
+    config = current_app.config
+    per_message, lease_seconds = outbox_lease_seconds(config)
+    token, claimed = claim_outbox_batch(config['OUTBOX_CLAIM_SIZE'], lease_seconds)
+    if not claimed:
+        return None
+    claim = OutboxClaim(token, lease_seconds, per_message)
+    results = {}
+    report = deliver(current_app._get_current_object(), mail, outbox_messages(claimed),
+                     batch_size=config['MAIL_BATCH_SIZE'],
+                     connections=config['MAIL_CONNECTIONS'],
+                     retries=config['MAIL_RETRIES'],
+                     backoff=config['MAIL_RETRY_BACKOFF'],
+                     timeout=config['MAIL_TIMEOUT'],
+                     on_result=lambda msg, error: results.__setitem__(msg.outbox_id, error),
+                     before_send=lambda msg: claim.hold(msg.outbox_id))
+
+    # Every write-back is conditional on the claim token: rows taken over by another worker are left alone.
+    now = datetime.utcnow()
+    sent_ids = [outbox_id for outbox_id, error in results.items() if error is None]
+    if sent_ids:
+        OutboxEmail.query.filter(OutboxEmail.id.in_(sent_ids), OutboxEmail.claim_token == token) \
+            .update({'status': 'sent', 'sent_at': now, 'locked_until': None, 'claim_token': None, 'last_error': None},
+                    synchronize_session=False)
+    for outbox_id, _, _, _, attempts in claimed:
+        error = results.get(outbox_id, 'not attempted')
+        if error is None:
+            continue
+        if attempts >= config['OUTBOX_MAX_ATTEMPTS']:
+            values = {'status': 'failed', 'locked_until': None, 'claim_token': None, 'last_error': error}
+        else:
+            retry_at = now + timedelta(seconds=config['OUTBOX_RETRY_BACKOFF'] * 2 ** (attempts - 1))
+            values = {'status': 'pending', 'available_at': retry_at, 'locked_until': None, 'claim_token': None,
+                      'last_error': error}
+        OutboxEmail.query.filter_by(id=outbox_id, claim_token=token).update(values, synchronize_session=False)
+    db.session.commit()
+
+    print("drain_outbox", f"{len(claimed)} claimed, {report['sent']} sent, {report['failed']} failed,",
+          f"{report['throughput']:.1f} msg/s")
+    return report
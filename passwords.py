@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from metrics import metrics
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def expand_method(method):
+    # Spells out werkzeug's defaults, so "scrypt" compares equal to the "scrypt:32768:8:1" prefix of stored hashes.
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        defaults = ['32768', '8', '1']
+    elif name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    else:
+        return method
+    return ':'.join([name] + args + defaults[len(args):])
+
+
+class PasswordHasher:
+    # Hashes and checks passwords in `workers` separate processes, so a burst of logins costs pool CPU instead
+    # of blocking request workers (a gevent worker cannot switch greenlets during a hash). At most `max_pending`
+    # hashes are queued or running per web process; beyond that callers get HasherBusy straight away.
+    # Pool processes run at `nice` lower priority, so on a busy dyno request handling gets the CPU first.
+    # workers=0 hashes in the calling thread.
+    def __init__(self, method='scrypt', workers=1, max_pending=4, timeout=5, nice=10):
+        self.method = expand_method(method)
+        self.workers = workers
+        self.nice = nice
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+
+    def _run(self, function, *args):
+        started = time.perf_counter()
+        if not self.workers:
+            result = function(*args)
+            metrics.observe('password_hash_duration_seconds', {}, time.perf_counter() - started)
+            return result
+        with self._lock:
+            if self.pending >= self.max_pending:
+                metrics.inc('password_hash_rejections_total', {'reason': 'queue_full'})
+                raise HasherBusy('too many password hashes in progress')
+            if self._pool is None:
+                # Spawned rather than forked: children of a gevent-patched worker must not inherit its hub.
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=os.nice, initargs=(self.nice,))
+            pool = self._pool
+            self.pending += 1
+        try:
+            future = pool.submit(function, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._reset_pool(pool)
+            self._release(None)
+            raise HasherBusy('password hashing pool is restarting')
+        # The slot is freed when the hash finishes, not when a caller gives up on it.
+        future.add_done_callback(self._release)
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            metrics.inc('password_hash_rejections_total', {'reason': 'timeout'})
+            raise HasherBusy('password hashing timed out')
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            metrics.inc('password_hash_rejections_total', {'reason': 'broken_pool'})
+            raise HasherBusy('password hashing pool is restarting')
+        metrics.observe('password_hash_duration_seconds', {}, time.perf_counter() - started)
+        return result
+
+    def _reset_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,123 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import PrefixCache, RecentKeys, Refresher, create_cache
+from city_index import CityIndex, normalize as normalize_city_name
+from feeds import WeatherFeeds
+from passwords import PasswordHasher
+from upstream import DailyQuota, UpstreamClient
+
+
+def threads_are_greenlets():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+class lazy:
+    # Builds the attribute on first access, exactly once even when several threads race for it;
+    # afterwards the value sits in the instance __dict__ and the descriptor is bypassed.
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        with self.lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.build(instance)
+        return instance.__dict__[self.name]
+
+
+class Services:
+    # Upstream client, caches, thread pool and city index shared by the views and jobs. Nothing is built
+    # when the app is created: a worker only pays for the pieces its first requests actually use.
+    # Holds the app config rather than reading current_app, so it also works from pool and cache threads.
+    def __init__(self):
+        self.config = {}
+
+    def init_app(self, app):
+        for name, attribute in vars(Services).items():
+            if isinstance(attribute, lazy):
+                self.__dict__.pop(name, None)
+        self.config = app.config
+        app.extensions['services'] = self
+
+    @lazy
+    def upstream(self):
+        return UpstreamClient(pool_maxsize=self.config['UPSTREAM_POOL_MAXSIZE'],
+                              connect_timeout=self.config['UPSTREAM_CONNECT_TIMEOUT'],
+                              read_timeout=self.config['UPSTREAM_READ_TIMEOUT'],
+                              retries=self.config['UPSTREAM_RETRIES'],
+                              backoff=self.config['UPSTREAM_RETRY_BACKOFF'],
+                              failure_threshold=self.config['UPSTREAM_BREAKER_THRESHOLD'],
+                              reset_timeout=self.config['UPSTREAM_BREAKER_RESET'])
+
+    @lazy
+    def weather_cache(self):
+        return create_cache(self.config, 'weather')
+
+    @lazy
+    def forecast_cache(self):
+        return create_cache(self.config, 'forecast')
+
+    @lazy
+    def news_cache(self):
+        # Kept long past expiry: once the daily NewsAPI cap is reached, stale articles beat an error.
+        return create_cache(self.config, 'news', ttl=self.config['NEWS_CACHE_TTL'],
+                            stale_if_error=self.config['NEWS_STALE_IF_ERROR'])
+
+    @lazy
+    def news_quota(self):
+        return DailyQuota(self.config['NEWS_DAILY_LIMIT'] // (self.config['WEB_CONCURRENCY'] * self.config['WEB_DYNOS']))
+
+    @lazy
+    def news_views(self):
+        return RecentKeys(self.config['NEWS_REFRESH_MAX_CITIES'])
+
+    @lazy
+    def news_refresher(self):
+        return Refresher('news-refresh')
+
+    @lazy
+    def weather_prewarmer(self):
+        return Refresher('weather-prewarm')
+
+    @lazy
+    def city_index(self):
+        return CityIndex.open(self.config['CITY_INDEX_PATH'])
+
+    @lazy
+    def city_search_cache(self):
+        return PrefixCache(normalize_city_name, self.config['SEARCH_CITY_CACHE_MAX_SIZE'],
+                           self.config['SEARCH_CITY_CACHE_TTL'], self.config['CACHE_STALE_IF_ERROR'])
+
+    @lazy
+    def weather_fetch_workers(self):
+        # Under gevent the pool's threads are greenlets, so it can be as wide as the requests a worker serves;
+        # a fixed handful would queue every multi-city fetch of all 200 connections behind each other.
+        return self.config['WEATHER_FETCH_WORKERS'] or \
+            (self.config['WEB_WORKER_CONNECTIONS'] if threads_are_greenlets() else 8)
+
+    @lazy
+    def weather_executor(self):
+        return ThreadPoolExecutor(max_workers=self.weather_fetch_workers, thread_name_prefix='weather-fetch')
+
+    @lazy
+    def weather_feeds(self):
+        # weather.py imports this module, so its fetch function is only imported once feeds are needed.
+        from weather import get_weather_data
+        return WeatherFeeds(get_weather_data, self.config['WEATHER_STREAM_INTERVAL'])
+
+    @lazy
+    def password_hasher(self):
+        return PasswordHasher(self.config['PASSWORD_HASH_METHOD'], self.config['PASSWORD_HASH_WORKERS'],
+                              self.config['PASSWORD_HASH_MAX_PENDING'], self.config['PASSWORD_HASH_TIMEOUT'],
+                              self.config['PASSWORD_HASH_NICE'])
+
+
+services = Services()
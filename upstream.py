@@ -0,0 +1,219 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import metrics
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures; after `reset_timeout` seconds a single
+    # trial request is let through and its outcome closes or re-opens the circuit.
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip(self.buckets, self.counts):
+                cumulative += count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+            return {'count': self.count, 'sum': round(self.sum, 6), 'buckets': buckets}
+
+
+class DailyQuota:
+    # Counts calls against a provider's daily request cap (reset at midnight UTC). `reserve` keeps the
+    # last calls of the day for callers that pass a smaller one, e.g. on-demand views over background refreshes.
+    def __init__(self, limit):
+        self.limit = limit
+        self.day = None
+        self.used = 0
+        self.denied = 0
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def _roll_over(self):
+        today = datetime.now(timezone.utc).date()
+        if today != self.day:
+            self.day = today
+            self.used = 0
+            self.exhausted = False
+
+    def remaining(self):
+        with self._lock:
+            self._roll_over()
+            return 0 if self.exhausted else max(0, self.limit - self.used)
+
+    def acquire(self, reserve=0):
+        with self._lock:
+            self._roll_over()
+            if self.exhausted or self.used + reserve >= self.limit:
+                self.denied += 1
+                return False
+            self.used += 1
+            return True
+
+    def exhaust(self):
+        # The provider itself reported the cap as reached; stop calling until the next day.
+        with self._lock:
+            self._roll_over()
+            self.exhausted = True
+
+    def stats(self):
+        with self._lock:
+            self._roll_over()
+            return {'limit': self.limit, 'used': self.used, 'denied': self.denied, 'exhausted': self.exhausted,
+                    'day': self.day.isoformat()}
+
+
+class UpstreamClient:
+    # Shared by every endpoint and scheduler job: keep-alive pools per host, connect/read timeouts,
+    # bounded retries with jittered exponential backoff and one circuit breaker per provider.
+    def __init__(self, pool_maxsize=50, connect_timeout=3.05, read_timeout=10, retries=2, backoff=0.2,
+                 failure_threshold=5, reset_timeout=30):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.breakers = {}
+        self.latencies = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, provider):
+        with self._lock:
+            if provider not in self.breakers:
+                self.breakers[provider] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[provider]
+
+    def histogram(self, host):
+        with self._lock:
+            if host not in self.latencies:
+                self.latencies[host] = LatencyHistogram()
+            return self.latencies[host]
+
+    def _observe(self, provider, histogram, started, outcome):
+        elapsed = time.perf_counter() - started
+        histogram.observe(elapsed)
+        metrics.observe('upstream_request_duration_seconds', {'provider': provider}, elapsed, LATENCY_BUCKETS)
+        metrics.inc('upstream_requests_total', {'provider': provider, 'outcome': outcome})
+
+    def _sleep_before_retry(self, attempt):
+        time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def get(self, provider, url, retries=None, **kwargs):
+        # `retries` overrides the client's retry count, e.g. 0 where every attempt is charged to a quota.
+        retries = self.retries if retries is None else retries
+        histogram = self.histogram(urlparse(url).netloc)
+        kwargs.setdefault('timeout', self.timeout)
+        breaker = self.breaker(provider)
+        if not breaker.allow():
+            metrics.inc('upstream_requests_total', {'provider': provider, 'outcome': 'circuit_open'})
+            raise CircuitOpenError(f'{provider} circuit is open')
+
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self._observe(provider, histogram, started, 'error')
+                if attempt == retries:
+                    breaker.record_failure()
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+            except Exception:
+                # Not worth retrying (bad URL, broken encoding, redirect loop), but it must still end a half-open
+                # trial, or the circuit would stay shut until the process restarts.
+                self._observe(provider, histogram, started, 'error')
+                breaker.record_failure()
+                raise
+            self._observe(provider, histogram, started, str(response.status_code))
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                self._sleep_before_retry(attempt)
+                continue
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            return response
+
+    def stats(self):
+        with self._lock:
+            breakers = dict(self.breakers)
+            latencies = dict(self.latencies)
+        return {
+            'providers': {provider: {'state': breaker.state, 'consecutive_failures': breaker.failures}
+                          for provider, breaker in breakers.items()},
+            'latency': {host: histogram.snapshot() for host, histogram in latencies.items()},
+        }
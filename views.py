@@ -0,0 +1,366 @@
+import json
+import os
+import re
+import time
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import available_timezones
+
+from flask import Blueprint, Response, current_app, flash, g, jsonify, redirect, render_template, request, \
+    send_from_directory, url_for
+from flask_login import current_user, login_required, login_user, logout_user
+from flask_wtf import FlaskForm
+from sqlalchemy.orm import selectinload
+from wtforms import PasswordField, StringField, SubmitField
+from wtforms.validators import DataRequired
+
+from extensions import db, login_manager
+from metrics import metrics
+from models import City, User, add_user_city, emails, favourites, load_metrics_snapshots
+from notifications import confirm_token, send_email_verification_email
+from passwords import HasherBusy
+from services import services
+from weather import get_city_dashboard, get_city_owm_id, get_forecast_data, get_news_data, get_weather_data, \
+    get_weather_data_many, search_cities, start_prewarming, store_city_locations
+
+bp = Blueprint('main', __name__)
+
+
+@bp.route('/favicon.ico')
+def favicon():
+    return send_from_directory(os.path.join(current_app.root_path, 'static'),
+                               'favicon.ico', mimetype='image/vnd.microsoft.icon')
+
+# Relationships are lazy; only the views that read a user's cities eager-load them together with the user.
+USER_LOAD_OPTIONS = {
+    'main.settings': [selectinload(User.favorite_cities), selectinload(User.emails_enabled)],
+    'main.get_multiple_weather': [selectinload(User.favorite_cities)],
+    'main.weather_stream': [selectinload(User.favorite_cities)],
+}
+
+@login_manager.user_loader
+def load_user(user_id):
+    return db.session.get(User, int(user_id), options=USER_LOAD_OPTIONS.get(request.endpoint, []))
+
+@bp.after_app_request
+def add_query_count_header(response):
+    if current_app.config['QUERY_COUNT_HEADER']:
+        response.headers['X-Query-Count'] = str(g.get('query_count', 0))
+        response.headers['X-Query-Time'] = f"{g.get('query_time', 0.0) * 1000:.2f}ms"
+    return response
+
+def hashing_busy_response():
+    # Password hashing is saturated (e.g. a credential-stuffing wave); refuse quickly instead of queueing.
+    return jsonify({'status': 'failure', 'message': 'Too many sign-ins right now, please try again in a moment'}), \
+        503, {'Retry-After': '1'}
+
+class RegisterForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    email = StringField('Email', validators=[DataRequired()])
+    password = PasswordField('Password', validators=[DataRequired()])
+    submit = SubmitField('Register')
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register():
+    form = RegisterForm()
+    if request.method == 'POST':
+        username = request.form.get('username')
+        email = request.form.get('email')
+        password = request.form.get('password')
+
+        existing_username = User.query.filter_by(username=username).first()
+        existing_email = User.query.filter_by(email=email).first()
+
+        if existing_username or existing_email:
+            return jsonify({'status': 'failure', 'message': 'User already exists or e-mail already used'})
+
+        email_verification_pattern = r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$"
+        if not bool(re.match(email_verification_pattern, email)):
+            return jsonify({'status': 'failure', 'message': 'E-mail not in supported format'})
+
+        try:
+            hashed_password = services.password_hasher.hash(password)
+        except HasherBusy:
+            return hashing_busy_response()
+
+        send_email_verification_email(email)
+
+        new_user = User(username=username, email=email, password=hashed_password)
+        db.session.add(new_user)
+        db.session.commit()
+        return jsonify({'status': 'success'})
+    else :
+        return render_template('register.html', form=form)
+
+class LoginForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    password = PasswordField('Password', validators=[DataRequired()])
+    submit = SubmitField('Login')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    form = LoginForm()
+    if request.method == 'POST':
+        username = request.form['username']
+        password = request.form['password']
+
+        user = User.query.filter_by(username=username).first()
+
+        try:
+            valid = user is not None and services.password_hasher.verify(user.password, password)
+        except HasherBusy:
+            return hashing_busy_response()
+
+        if valid:
+            if services.password_hasher.needs_rehash(user.password):
+                # The hash cost settings changed since this password was stored; upgrade it while we have it.
+                try:
+                    user.password = services.password_hasher.hash(password)
+                    db.session.commit()
+                except HasherBusy:
+                    pass  # retried on the next login
+            login_user(user)
+            return jsonify({'status': 'success'})
+        return jsonify({'status': 'failure', 'message': 'Invalid credentials'})
+    else :
+        return render_template('login.html', form=form)
+
+@bp.route('/logout')
+@login_required
+def logout():
+    logout_user()
+    return redirect(url_for('main.index'))
+
+@bp.route('/')
+def index():
+    return render_template('index.html', current_user=current_user)
+
+@bp.route('/get_weather', methods=['POST'])
+@login_required
+def get_weather():
+    city = request.form['city']
+    owm_id = get_city_owm_id(city)
+    weather = get_weather_data(city, owm_id)
+    if owm_id is None:
+        store_city_locations({city: weather})
+    return jsonify(weather)
+
+@bp.route('/get_multiple_weather', methods=['POST'])
+def get_multiple_weather():
+    is_logged_in = current_user.is_authenticated if hasattr(current_user, 'is_authenticated') else False
+    cities = []
+    city_ids = {}
+    if is_logged_in:
+        user_id = current_user.id
+        user = db.session.get(User, user_id)
+        cities = [fav_city.name for fav_city in user.favorite_cities]
+        city_ids = {fav_city.name: fav_city.owm_id for fav_city in user.favorite_cities}
+    if is_logged_in == False or len(cities) == 0:
+        cities = request.json.get('cities', [])
+    start_prewarming(current_app._get_current_object())
+    weather_data = get_weather_data_many(cities, city_ids)
+    store_city_locations({city: weather for city, weather in zip(cities, weather_data)
+                          if city in city_ids and city_ids[city] is None})
+    return jsonify(weather_data)
+
+@bp.route('/weather_stream')
+@login_required
+def weather_stream():
+    # Server-Sent Events with the favourites' weather: the current data of each city first, then only the fields
+    # that changed. Clients share one refresh loop per city (see feeds.py); an idle stream is a parked greenlet
+    # under gevent. Streams end after WEATHER_STREAM_MAX_AGE and the browser reconnects on its own.
+    city_ids = {city.name: city.owm_id for city in current_user.favorite_cities}
+    if not city_ids:
+        return '', 204  # tells EventSource not to reconnect
+    feeds = services.weather_feeds
+    heartbeat = current_app.config['WEATHER_STREAM_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['WEATHER_STREAM_MAX_AGE']
+
+    def events():
+        # Subscribed inside the generator, so the finally clause runs for every subscription that was made.
+        subscription = feeds.subscribe(city_ids)
+        try:
+            yield 'retry: 5000\n\n'
+            while time.monotonic() < deadline:
+                updates = subscription.take(heartbeat)
+                if not updates:
+                    yield ': keep-alive\n\n'  # also how a closed connection is noticed
+                for city, changes in updates.items():
+                    yield f"event: weather\ndata: {json.dumps({'city': city, 'changes': changes})}\n\n"
+        finally:
+            feeds.unsubscribe(subscription)
+
+    response = Response(events(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@bp.route('/cache_stats')
+@login_required
+def cache_stats():
+    return jsonify({'weather': dict(services.weather_cache.stats(), prewarmer=services.weather_prewarmer.stats()),
+                    'forecast': services.forecast_cache.stats(),
+                    'news': dict(services.news_cache.stats(), refresher=services.news_refresher.stats(),
+                                 recently_viewed=len(services.news_views)),
+                    'search_city': services.city_search_cache.stats()})
+
+@bp.route('/upstream_stats')
+@login_required
+def upstream_stats():
+    return jsonify(dict(services.upstream.stats(), quotas={'newsapi': services.news_quota.stats()}))
+
+@bp.route('/metrics')
+def export_metrics():
+    # Scraped by Prometheus rather than viewed by users. Needs a bearer token unless metrics_public is set.
+    token = current_app.config['METRICS_TOKEN']
+    if not token and not current_app.config['METRICS_PUBLIC']:
+        return jsonify({'error': 'Set metrics_token (or metrics_public) to enable metrics'}), 403
+    if token and request.headers.get('Authorization') != 'Bearer ' + token:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        workers = load_metrics_snapshots(current_app.config['METRICS_SNAPSHOT_MAX_AGE'])
+    except Exception as e:
+        db.session.rollback()
+        print("error export_metrics", str(e))
+        workers = []
+    return Response(metrics.render(workers), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/forecast', methods=['POST'])
+@login_required
+def get_forecast():
+    city = request.form['city']
+    return jsonify(get_forecast_data(city, get_city_owm_id(city)))
+
+@bp.route('/city_dashboard')
+@login_required
+def city_dashboard():
+    city = request.args.get('city')
+    if not city:
+        return jsonify({'error': 'City name is missing'}), 400
+    owm_id = get_city_owm_id(city)
+    dashboard = get_city_dashboard(city, owm_id)
+    if owm_id is None:
+        store_city_locations({city: dashboard['weather']})
+    # Browsers keep the response and revalidate it with If-None-Match, so a repeat view of an unchanged
+    # city is answered with an empty 304.
+    response = jsonify(dashboard)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.route('/add_favourite', methods=['POST'])
+@login_required
+def add_favourite():
+    city = request.get_json().get('city_name')
+
+    if not city:
+        return jsonify({'error': 'City name is missing'}), 400
+
+    added = add_user_city(favourites, current_user.id, city)
+    return jsonify({'isFavorite': not added})
+
+@bp.route('/send_scheduled_notifications', methods=['POST'])
+@login_required
+def add_city_to_weather_email():
+    city = request.get_json().get('city_name')
+
+    if not city:
+        return jsonify({'error': 'City name is missing'}), 400
+
+    elif current_user.email_confirmed:
+        if add_user_city(emails, current_user.id, city):
+            return jsonify({'hasUnconfirmedEmail': False})
+
+        return jsonify({'error': 'E-mails already enabled for this city'}), 400
+
+    else:
+        return jsonify({'hasUnconfirmedEmail': True})
+
+@bp.route('/get_local_news', methods=['POST'])
+def get_local_news():
+    city = request.get_json().get('city_name')
+    news = get_news_data(city)
+    if 'error' in news:
+        return jsonify({'error': news['error'], 'articles':[]})
+    return jsonify({'error':None, 'articles': news['articles']})
+
+@bp.route('/search_city')
+def search_city():
+    return jsonify(search_cities(request.args.get('q')))
+
+@bp.route('/confirm/<token>', methods=['GET'])
+def confirm_email(token):
+    try:
+        email = confirm_token(token)
+    except:
+        flash('The confirmation link is invalid or has expired.', 'danger')
+    user = User.query.filter_by(email=email).first()
+    if user.email_confirmed:
+        flash('E-mail already confirmed', 'warning')
+    else:
+        user.email_confirmed = True
+        user.email_confirmed_on = datetime.now()
+        db.session.add(user)
+        db.session.commit()
+        flash('Thank you for confirming your email address!', 'success')
+        return redirect(url_for('main.index'))
+
+@bp.route('/settings', methods=['GET', 'POST'])
+@login_required
+def settings():
+    if request.method == 'POST':
+        new_password = request.form.get('password')
+
+        if new_password:
+            try:
+                current_user.password = services.password_hasher.hash(new_password)
+            except HasherBusy:
+                # Nothing is saved, so the whole form can simply be submitted again.
+                flash('Settings could not be saved right now, please try again', 'danger')
+                return redirect(url_for('main.settings'))
+
+        updated_favourites = request.form.getlist('favourites')
+        current_user.favorite_cities = City.query.filter(City.id.in_(updated_favourites)).all()
+
+        updated_enabled = request.form.getlist('enabled')
+        current_user.emails_enabled = City.query.filter(City.id.in_(updated_enabled)).all()
+
+        notification_time = request.form.get('notification_time')
+        if notification_time:
+            try:
+                parsed_time = datetime.strptime(notification_time, '%H:%M')
+                current_user.notification_minute = parsed_time.hour * 60 + parsed_time.minute
+            except ValueError:
+                flash('Notification time must be in HH:MM format', 'danger')
+
+        notification_timezone = request.form.get('timezone')
+        if notification_timezone:
+            if notification_timezone in timezone_names():
+                current_user.timezone = notification_timezone
+            else:
+                flash('Unknown timezone', 'danger')
+
+        db.session.commit()
+        flash('Settings updated successfully!', 'success')
+        return redirect(url_for('main.settings'))
+
+    favourites = current_user.favorite_cities
+    enabled = current_user.emails_enabled
+    notification_time = f"{current_user.notification_minute // 60:02d}:{current_user.notification_minute % 60:02d}"
+    return render_template('settings.html', user=current_user, favourites=favourites, enabled=enabled,
+                           notification_time=notification_time, timezones=timezone_names())
+
+@lru_cache(maxsize=1)
+def timezone_names():
+    return sorted(available_timezones())
+
+@bp.route('/send_confirmation_email', methods=['GET'])
+@login_required
+def send_confirmation_email():
+    if not current_user.email_confirmed:
+        send_email_verification_email(current_user.email)
+        flash('Confirmation email sent successfully!', 'success')
+    else:
+        flash('Email is already confirmed!', 'info')
+    return redirect(url_for('main.settings'))
@@ -0,0 +1,316 @@
+import math
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+
+import requests
+
+from sqlalchemy import desc, func
+
+from city_index import city_key, normalize as normalize_city_name
+from extensions import db
+from forecast import seconds_until_next_slot, summarize_forecast
+from metrics import metrics
+from models import City, emails, favourites
+from services import services
+
+GROUP_SIZE = 20
+
+
+def get_city_owm_id(name):
+    row = db.session.query(City.owm_id).filter_by(name_key=city_key(name)).first()
+    return row.owm_id if row else None
+
+def store_city_locations(weather_by_city):
+    # Remembers the OpenWeatherMap id and coordinates resolved by a by-name lookup,
+    # so later fetches for these cities can use id-based and group requests.
+    updated = False
+    for name, weather in weather_by_city.items():
+        if 'error' in weather or not weather.get('id'):
+            continue
+        updated = City.query.filter(City.name_key == city_key(name), City.owm_id.is_(None)) \
+            .update({'owm_id': weather['id'], 'lat': weather['lat'], 'lon': weather['lon']},
+                    synchronize_session=False) > 0 or updated
+    if updated:
+        db.session.commit()
+
+def parse_weather_data(data):
+    main = data.get("main", {})
+    coord = data.get("coord", {})
+    weather = data["weather"][0] if data.get("weather") else {}
+    return {
+        'id': data.get('id'),
+        'city': data.get('name'),
+        'temperature': main.get("temp"),
+        'description': weather.get("description"),
+        'icon': weather.get("icon"),
+        'lon': coord.get("lon"),
+        'lat': coord.get("lat")
+    }
+
+def fetch_weather_data(city, owm_id=None):
+    if owm_id:
+        complete_url = services.config['OWM_BASE_URL'] + "id=" + str(owm_id) + "&appid=" + services.config['OWM_API_KEY']
+    else:
+        complete_url = services.config['OWM_BASE_URL'] + "q=" + city + "&appid=" + services.config['OWM_API_KEY']
+    try:
+        response = services.upstream.get('openweathermap', complete_url,
+                                         timeout=(services.config['UPSTREAM_CONNECT_TIMEOUT'],
+                                                  services.config['WEATHER_FETCH_TIMEOUT']))
+        data = response.json()
+    except (requests.RequestException, ValueError):
+        return {'error': 'Failed to fetch weather data for ' + city}
+
+    if data.get("cod") not in (404, "404"):
+        return parse_weather_data(data)
+    else:
+        return {'error': 'Unknown error occured'}
+
+def fetch_weather_group(cities_by_id):
+    # One group request covers up to GROUP_SIZE cities; results go straight into the weather cache.
+    complete_url = services.config['OWM_GROUP_URL'] + "id=" + ",".join(str(owm_id) for owm_id in cities_by_id) \
+        + "&appid=" + services.config['OWM_API_KEY']
+    response = services.upstream.get('openweathermap', complete_url,
+                                     timeout=(services.config['UPSTREAM_CONNECT_TIMEOUT'],
+                                              services.config['WEATHER_FETCH_TIMEOUT']))
+    if response.status_code != 200:
+        return 0
+    stored = 0
+    for data in response.json().get('list', []):
+        city = cities_by_id.get(data.get('id'))
+        if city is not None:
+            services.weather_cache.set(city, parse_weather_data(data))
+            stored += 1
+    return stored
+
+def prefetch_weather_groups(city_ids):
+    expired = {owm_id: city for city, owm_id in city_ids.items()
+               if owm_id and (services.weather_cache.expires_in(city) or 0) <= 0}
+    owm_ids = list(expired)
+    futures = [services.weather_executor.submit(fetch_weather_group,
+                                                {owm_id: expired[owm_id] for owm_id in owm_ids[i:i + GROUP_SIZE]})
+               for i in range(0, len(owm_ids), GROUP_SIZE)]
+    for future in futures:
+        try:
+            future.result(timeout=services.config['WEATHER_FETCH_TIMEOUT'])
+        except Exception:
+            pass  # cities missing from the cache fall back to single-city fetches
+
+def get_weather_data(city, owm_id=None):
+    return services.weather_cache.get_or_set(city, lambda: fetch_weather_data(city, owm_id))
+
+def get_weather_data_many(cities, city_ids=None):
+    # Results keep the order of `cities`; a failed or timed out city only affects its own entry.
+    # Cities with a known OpenWeatherMap id are fetched GROUP_SIZE per request first.
+    city_ids = city_ids or {}
+    prefetch_weather_groups({city: city_ids.get(city) for city in cities})
+    timeout = services.config['WEATHER_FETCH_TIMEOUT']
+    waves = math.ceil(len(cities) / services.weather_fetch_workers) or 1
+    deadline = time.monotonic() + timeout * waves
+    futures = [services.weather_executor.submit(get_weather_data, city, city_ids.get(city)) for city in cities]
+    weather_data = []
+    for city, future in zip(cities, futures):
+        try:
+            weather_data.append(future.result(timeout=max(0, deadline - time.monotonic())))
+        except FutureTimeoutError:
+            future.cancel()
+            weather_data.append({'error': 'Timed out fetching weather data for ' + city})
+        except Exception:
+            weather_data.append({'error': 'Failed to fetch weather data for ' + city})
+    return weather_data
+
+def fetch_forecast_data(city, owm_id=None):
+    location = "id=" + str(owm_id) if owm_id else "q=" + city
+    try:
+        response = services.upstream.get('openweathermap', services.config['OWM_FORECAST_URL'] + location
+                                         + "&appid=" + services.config['OWM_API_KEY'])
+    except requests.RequestException:
+        return {"error": "Failed to fetch forecast data for " + city}
+
+    if response.status_code != 200:
+        return {"error": "Failed to fetch forecast data for " + city}
+
+    try:
+        return summarize_forecast(response.json())
+    except (ValueError, KeyError, TypeError):
+        return {"error": "Failed to fetch forecast data for " + city}
+
+def get_forecast_data(city, owm_id=None):
+    # OpenWeatherMap publishes a new forecast every 3 hours, so summaries live until the next slot.
+    return services.forecast_cache.get_or_set(city, lambda: fetch_forecast_data(city, owm_id),
+                                              ttl=seconds_until_next_slot())
+
+def fetch_local_news(city, reserve=0):
+    # Spends one call of the per-process NewsAPI budget; when the budget is gone this returns an error,
+    # so the news cache serves the last stored articles instead.
+    if not services.news_quota.acquire(reserve):
+        return {'error': 'News temporarily unavailable'}
+
+    query = f"+{city}"
+    window_start = datetime.now() - timedelta(days=services.config['NEWS_WINDOW_DAYS'])
+    searchIn = 'title,description'
+    params = {"apiKey" : services.config['NEWS_API_KEY'],
+               "q" : query,
+               "from": window_start.strftime('%Y-%m-%d'),
+               "sortBy" : services.config['NEWS_SORT_BY'],
+               "searchIn" : searchIn,
+               "pageSize" : 5}
+
+    try:
+        # No retries: each attempt is a NewsAPI request, but only one call was charged to the budget, and a 429
+        # means the daily cap itself.
+        response = services.upstream.get('newsapi', services.config['NEWS_URL'], params=params, retries=0)
+    except requests.RequestException:
+        return {'error': 'Unknown error occured'}
+
+    if response.status_code == 429:
+        services.news_quota.exhaust()
+        return {'error': 'News temporarily unavailable'}
+    if response.status_code != 200:
+        return {'error': 'Unknown error occured'}
+    try:
+        # Only what the page renders is kept; NewsAPI's "[Removed]" placeholders are dropped.
+        return {'articles': [{'title': article['title'], 'url': article['url'], 'urltoImage': article.get('urlToImage')}
+                             for article in response.json()["articles"]
+                             if article.get('url') and article.get('title') != '[Removed]']}
+    except (ValueError, KeyError, TypeError):
+        return {'error': 'Unknown error occured'}
+
+def get_news_data(city):
+    services.news_views.touch(city)
+    services.news_refresher.ensure_started(refresh_recent_news, services.config['NEWS_REFRESH_INTERVAL'])
+    return services.news_cache.get_or_set(city, lambda: fetch_local_news(city))
+
+def refresh_recent_news():
+    # Re-fetches news for cities viewed within NEWS_REFRESH_WINDOW before their entries expire, leaving
+    # NEWS_REFRESH_RESERVE calls of the daily budget to cities nobody has looked at yet.
+    refreshed = 0
+    for city in services.news_views.recent(services.config['NEWS_REFRESH_WINDOW']):
+        expires_in = services.news_cache.expires_in(city)
+        if expires_in is not None and expires_in > services.config['NEWS_REFRESH_INTERVAL']:
+            continue
+        news = fetch_local_news(city, reserve=services.config['NEWS_REFRESH_RESERVE'])
+        if 'error' in news:
+            break
+        services.news_cache.set(city, news)
+        refreshed += 1
+    return refreshed
+
+def get_popular_cities(limit):
+    city_users = db.session.query(favourites.c.city_id.label('city_id')) \
+        .union_all(db.session.query(emails.c.city_id.label('city_id'))) \
+        .subquery()
+    query = db.session.query(City.name, City.owm_id, func.count().label('users')) \
+        .join(city_users, city_users.c.city_id == City.id) \
+        .group_by(City.id, City.name, City.owm_id) \
+        .order_by(desc('users')) \
+        .limit(limit)
+    return [(name, owm_id) for name, owm_id, _ in query]
+
+def prewarm_weather():
+    # Refreshes the most favourited/subscribed cities in this process's caches before they expire. Each web
+    # process gets an equal share of PREWARM_CALLS_PER_MINUTE, so together they stay within the plan.
+    config = services.config
+    started = time.perf_counter()
+    interval = config['PREWARM_INTERVAL_MINUTES'] * 60
+    calls_per_minute = config['PREWARM_CALLS_PER_MINUTE'] / (config['WEB_CONCURRENCY'] * config['WEB_DYNOS'])
+    call_spacing = 60 / calls_per_minute
+    budget = int(calls_per_minute * config['PREWARM_INTERVAL_MINUTES'])
+    calls = 0
+    cities = get_popular_cities(config['PREWARM_CITIES'])
+    for city, owm_id in cities:
+        if calls >= budget:
+            break
+        expires_in = services.weather_cache.expires_in(city)
+        if expires_in is None or expires_in < interval:
+            weather = fetch_weather_data(city, owm_id)
+            if 'error' not in weather:
+                services.weather_cache.set(city, weather)
+            calls += 1
+            time.sleep(call_spacing)
+        forecast_expires_in = services.forecast_cache.expires_in(city)
+        if calls < budget and (forecast_expires_in is None or forecast_expires_in <= 0):
+            forecast = fetch_forecast_data(city, owm_id)
+            if 'error' not in forecast:
+                services.forecast_cache.set(city, forecast, ttl=seconds_until_next_slot())
+            calls += 1
+            time.sleep(call_spacing)
+    print("prewarm_weather", f"{len(cities)} cities, {calls} upstream calls, {time.perf_counter() - started:.1f}s")
+    return calls
+
+def start_prewarming(app):
+    # Started from the first request a web process serves: the caches being warmed live in that process.
+    if not services.config['PREWARM_CITIES']:
+        return
+
+    def refresh():
+        with app.app_context(), metrics.record_job('prewarm_weather') as run:
+            run['items'] = prewarm_weather()
+        return run['items']
+    services.weather_prewarmer.ensure_started(refresh, services.config['PREWARM_INTERVAL_MINUTES'] * 60)
+
+def get_city_dashboard(city, owm_id=None):
+    # Current weather, forecast and news fetched side by side on the weather pool. A section that fails or
+    # misses the DASHBOARD_TIMEOUT deadline becomes {'error': ...} without holding back the others.
+    sections = {
+        'weather': services.weather_executor.submit(get_weather_data, city, owm_id),
+        'forecast': services.weather_executor.submit(get_forecast_data, city, owm_id),
+        'news': services.weather_executor.submit(get_news_data, city),
+    }
+    deadline = time.monotonic() + services.config['DASHBOARD_TIMEOUT']
+    dashboard = {'city': city}
+    for name, future in sections.items():
+        try:
+            dashboard[name] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            future.cancel()
+            dashboard[name] = {'error': f'Timed out fetching {name} for ' + city}
+        except Exception:
+            dashboard[name] = {'error': f'Failed to fetch {name} for ' + city}
+    if 'error' not in dashboard['forecast']:
+        dashboard['forecast'] = {'timezone': dashboard['forecast']['timezone'], 'days': dashboard['forecast']['days']}
+    return dashboard
+
+def search_cities(query, limit=5):
+    # Local index first, then cached GeoNames prefixes, then one coalesced GeoNames call per prefix;
+    # during a GeoNames outage recently expired results are served instead of nothing.
+    if services.city_index is not None:
+        cities = services.city_index.search(query, limit)
+        if cities:
+            return cities
+
+    cache = services.city_search_cache
+    cities = cache.get(query, limit)
+    if cities is None:
+        cities = cache.flights.do(normalize_city_name(query), lambda: fetch_city_suggestions(query))
+        if cities is None:
+            cities = cache.get_stale(query, limit) or []
+        else:
+            cache.set(query, cities, complete=len(cities) < services.config['SEARCH_CITY_FETCH_ROWS'])
+
+    return [city['display'] for city in cities[:limit]]
+
+def fetch_city_suggestions(query):
+    params = {"name_startsWith": query,
+              "orderby": "population",
+              "maxRows": services.config['SEARCH_CITY_FETCH_ROWS'],
+              "username": services.config['GEONAMES_USERNAME']}
+    try:
+        response = services.upstream.get('geonames', services.config['GEONAMES_URL'], params=params)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        return None
+    if 'status' in data or 'geonames' not in data:
+        # GeoNames reports errors such as exhausted credits with HTTP 200; None keeps them out of the cache.
+        print("error fetch_city_suggestions", query, data.get('status'))
+        return None
+
+    return [{
+        'display': entry['name'] + ", " + entry['adminName1']+ ', ' + entry['countryName'],
+        'names': [normalize_city_name(entry['name']), normalize_city_name(entry.get('asciiName', entry['name']))]
+    } for entry in data['geonames']]
@@ -0,0 +1,52 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from app import app
+from jobs import run_scheduler
+from metrics import metrics
+from models import save_metrics_snapshot
+from notifications import drain_outbox
+
+# Web dynos never share a host with worker dynos, so the worker's numbers reach /metrics through the database
+# rather than METRICS_DIR.
+metrics.directory = None
+
+
+def publish_metrics(source):
+    with app.app_context():
+        try:
+            save_metrics_snapshot(source, metrics.snapshot(), app.config['METRICS_SNAPSHOT_MAX_AGE'])
+        except Exception as e:
+            print("error publish_metrics", str(e))
+
+
+# Drains the e-mail outbox and competes for scheduler leadership; run more worker processes to
+# increase mail throughput - only the elected leader runs the scheduled jobs.
+if __name__ == '__main__':
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    stop_event = threading.Event()
+    leader_thread = threading.Thread(target=run_scheduler, args=(app, stop_event), name='scheduler-leader', daemon=True)
+    leader_thread.start()
+    source = f"{socket.gethostname()}:{os.getpid()}"
+    published_at = 0
+    try:
+        while True:
+            started = time.perf_counter()
+            with app.app_context():
+                report = drain_outbox()
+            if report is None:
+                time.sleep(app.config['OUTBOX_POLL_INTERVAL'])
+            else:
+                # Empty polls are not runs; only batches that claimed rows are recorded.
+                metrics.observe_job('drain_outbox', time.perf_counter() - started, report['sent'])
+            if time.monotonic() - published_at >= app.config['METRICS_FLUSH_INTERVAL']:
+                publish_metrics(source)
+                published_at = time.monotonic()
+    finally:
+        stop_event.set()
+        leader_thread.join(timeout=10)
+        publish_metrics(source)